@@ -1,5 +1,5 @@
 from django.contrib import admin
-from like_system.models import Like
+from like_system.models import Like, LikeCounter
 
 
 class LikeAdmin(admin.ModelAdmin):
@@ -7,4 +7,10 @@ class LikeAdmin(admin.ModelAdmin):
     list_filter = ('content_type', )
     raw_id_fields = ('user', )
 
+
+class LikeCounterAdmin(admin.ModelAdmin):
+    list_display = ('content_type', 'object_pk', 'site', 'shard', 'count', )
+    list_filter = ('content_type', )
+
 admin.site.register(Like, LikeAdmin)
+admin.site.register(LikeCounter, LikeCounterAdmin)
@@ -0,0 +1,30 @@
+"""
+Storage backends of the likes, selected by a dotted path::
+
+    LIKE_STORAGE_BACKEND = 'like_system.backends.orm.ORMBackend'
+
+``ORMBackend`` (the default) stores likes with the like model and its
+counters, ``memory.MemoryBackend`` keeps them in the memory of the process.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+
+DEFAULT_BACKEND = 'like_system.backends.orm.ORMBackend'
+
+_backends = {}
+
+
+def get_backend():
+    """
+    Return the storage backend instance, shared by the whole process.
+    """
+    path = getattr(settings, 'LIKE_STORAGE_BACKEND', DEFAULT_BACKEND)
+    if path not in _backends:
+        try:
+            module, attr = path.rsplit('.', 1)
+            backend_class = getattr(import_module(module), attr)
+        except (ImportError, AttributeError, ValueError) as e:
+            raise ImproperlyConfigured("LIKE_STORAGE_BACKEND refers to an unknown backend %r (%s)" % (path, e))
+        _backends[path] = backend_class()
+    return _backends[path]
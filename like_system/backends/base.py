@@ -0,0 +1,71 @@
+from django.utils.encoding import smart_text
+
+from like_system.managers import LIKE
+
+
+class BaseLikeBackend(object):
+    """
+    Stores the likes of users. Objects are given as ``(content_type,
+    object_pk)``, users and sites as instances or primary keys.
+    """
+
+    def add(self, user, content_type, object_pk, site):
+        """
+        Like an object, returning whether the like is new.
+        """
+        raise NotImplementedError
+
+    def remove(self, user, content_type, object_pk, site):
+        """
+        Remove the like of a user, returning whether there was one.
+        """
+        raise NotImplementedError
+
+    def exists(self, user, content_type, object_pk, site):
+        return (getattr(content_type, 'pk', content_type), smart_text(object_pk)) in \
+            self.bulk_exists(user, [(content_type, object_pk)], site)
+
+    def count(self, content_type, object_pk, site):
+        return list(self.bulk_count([(content_type, object_pk)], site).values())[0]
+
+    def bulk_exists(self, user, targets, site):
+        """
+        Return the set of ``(content_type_id, object_pk)`` keys among
+        ``targets`` liked by ``user``.
+        """
+        raise NotImplementedError
+
+    def bulk_count(self, targets, site):
+        """
+        Return a ``{(content_type_id, object_pk): count}`` dict.
+        """
+        raise NotImplementedError
+
+    def list(self, content_type, object_pk, site, limit=None, after=None, rows=False):
+        """
+        Return the likes of an object, newest first. With a ``limit``, return
+        a ``LikePage`` of the likes following the cursor ``after``.
+        """
+        raise NotImplementedError
+
+    def iter_likes(self, content_type, object_pk, site, chunk_size=1000, rows=False):
+        """
+        Iterate over the likes of an object one page at a time.
+        """
+        cursor = None
+        while True:
+            page = self.list(content_type, object_pk, site, chunk_size, cursor, rows)
+            for like in page:
+                yield like
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+    def bulk_apply(self, operations):
+        """
+        Apply ``LikeOperation`` in order, returning whether each changed
+        anything.
+        """
+        return [(self.add if op.action == LIKE else self.remove)(op.user_id, op.content_type_id, op.object_pk,
+                                                                  op.site_id)
+                for op in operations]
@@ -0,0 +1,86 @@
+import itertools
+import threading
+
+from django.utils import timezone
+from django.utils.encoding import smart_text
+
+from like_system.backends.base import BaseLikeBackend
+from like_system.managers import LikePage, LikeRow, _pk, make_cursor, parse_cursor
+
+
+class MemoryBackend(BaseLikeBackend):
+    """
+    Keeps likes in the memory of the process, in a set of users per object
+    and a set of objects per user, for tests and benchmarks without a
+    database. Likes are lost on restart and not shared between processes,
+    and the ``like_added``/``like_removed`` signals are not sent.
+
+    ``list`` always returns ``LikeRow`` tuples, with the username of the user
+    when the like was added with a user instance.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # {(content_type_id, object_pk, site_id): set(user_id)}
+            self.users = {}
+            # {(user_id, site_id): set((content_type_id, object_pk))}
+            self.objects = {}
+            # {(content_type_id, object_pk, site_id, user_id): LikeRow}
+            self.rows = {}
+
+    def _key(self, content_type, object_pk, site):
+        return (_pk(content_type), smart_text(object_pk), _pk(site))
+
+    def add(self, user, content_type, object_pk, site):
+        key = self._key(content_type, object_pk, site)
+        user_id = _pk(user)
+        with self.lock:
+            users = self.users.setdefault(key, set())
+            if user_id in users:
+                return False
+            users.add(user_id)
+            self.objects.setdefault((user_id, key[2]), set()).add(key[:2])
+            username = user.get_username() if hasattr(user, 'get_username') else None
+            self.rows[key + (user_id,)] = LikeRow(next(self.ids), user_id, username, timezone.now())
+        return True
+
+    def remove(self, user, content_type, object_pk, site):
+        key = self._key(content_type, object_pk, site)
+        user_id = _pk(user)
+        with self.lock:
+            users = self.users.get(key, ())
+            if user_id not in users:
+                return False
+            users.discard(user_id)
+            self.objects[(user_id, key[2])].discard(key[:2])
+            del self.rows[key + (user_id,)]
+        return True
+
+    def bulk_exists(self, user, targets, site):
+        liked = self.objects.get((_pk(user), _pk(site)), set())
+        return set(key for key in ((_pk(ctype), smart_text(object_pk)) for ctype, object_pk in targets)
+                   if key in liked)
+
+    def bulk_count(self, targets, site):
+        return dict(((_pk(ctype), smart_text(object_pk)), len(self.users.get(self._key(ctype, object_pk, site), ())))
+                    for ctype, object_pk in targets)
+
+    def list(self, content_type, object_pk, site, limit=None, after=None, rows=False):
+        key = self._key(content_type, object_pk, site)
+        with self.lock:
+            likes = [self.rows[key + (user_id,)] for user_id in self.users.get(key, ())]
+        likes.sort(key=lambda row: (row.submit_date, row.pk), reverse=True)
+        if limit is None:
+            return likes
+        if after:
+            position = parse_cursor(after)
+            likes = [row for row in likes if (row.submit_date, row.pk) < position]
+        page = LikePage(likes[:limit])
+        if len(likes) > limit:
+            page.next_cursor = make_cursor(page[-1])
+        return page
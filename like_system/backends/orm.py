@@ -0,0 +1,40 @@
+import like_system
+from like_system.backends.base import BaseLikeBackend
+from like_system.models import LikeCounter
+
+
+class ORMBackend(BaseLikeBackend):
+    """
+    Stores likes with the like model, counts are read from ``LikeCounter``.
+    """
+
+    @property
+    def manager(self):
+        return like_system.get_model().objects
+
+    def add(self, user, content_type, object_pk, site):
+        like, created = self.manager.like(user, content_type, object_pk, site)
+        return created
+
+    def remove(self, user, content_type, object_pk, site):
+        return self.manager.unlike(user, content_type, object_pk, site)
+
+    def bulk_exists(self, user, targets, site):
+        return self.manager.liked_keys(user, targets, site)
+
+    def count(self, content_type, object_pk, site):
+        return LikeCounter.objects.get_count(content_type, object_pk, site)
+
+    def bulk_count(self, targets, site):
+        return LikeCounter.objects.get_counts(targets, site)
+
+    def list(self, content_type, object_pk, site, limit=None, after=None, rows=False):
+        if limit is None:
+            return self.manager.list_for_object(content_type, object_pk, site, rows)
+        return self.manager.page(content_type, object_pk, site, limit, after, rows)
+
+    def iter_likes(self, content_type, object_pk, site, chunk_size=1000, rows=False):
+        return self.manager.iter_likes(content_type, object_pk, site, chunk_size, rows)
+
+    def bulk_apply(self, operations):
+        return self.manager.bulk_apply(operations)
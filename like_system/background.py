@@ -0,0 +1,93 @@
+"""
+Optional background sending of the ``like_added``/``like_removed`` signals.
+
+The receivers of the signals (cache invalidation, leaderboard scores, liked
+indexes, Bloom filters) run in a small pool of threads instead of the
+request thread::
+
+    LIKE_BACKGROUND_SIGNALS = True
+    LIKE_BACKGROUND_WORKERS = 4
+
+Cached counts and liked states may lag the write by the time the signal
+waits in the queue. Signals are sent in order by each worker but not
+across workers.
+
+Signals are sent once the transaction of the write commits on Django
+versions with commit hooks. Older versions send them when the write path
+leaves its own transaction block, which commits the write unless the
+block is nested in an open transaction (``ATOMIC_REQUESTS``,
+``TransactionMiddleware``): there the receivers run before the commit.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from like_system.compat import on_commit
+from django.utils.six.moves import queue
+
+DEFAULT_WORKERS = 4
+
+logger = logging.getLogger('like_system')
+
+_queue = queue.Queue()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'LIKE_BACKGROUND_SIGNALS', False)
+
+
+def _close_connections():
+    # the workers outlive requests, which is when Django closes connections
+    for connection in connections.all():
+        connection.close()
+
+
+def _work():
+    while True:
+        signal, kwargs = _queue.get()
+        try:
+            signal.send(**kwargs)
+        except Exception:
+            logger.exception("Error sending %r in the background", signal)
+        finally:
+            if _queue.empty():
+                _close_connections()
+            _queue.task_done()
+
+
+def _start_workers():
+    with _workers_lock:
+        missing = getattr(settings, 'LIKE_BACKGROUND_WORKERS', DEFAULT_WORKERS) - len(_workers)
+        for i in range(missing):
+            worker = threading.Thread(target=_work, name='like_system-background-%d' % len(_workers))
+            worker.daemon = True
+            worker.start()
+            _workers.append(worker)
+
+
+def send(signal, using=None, **kwargs):
+    """
+    Send a signal once the transaction open on ``using`` commits, in the
+    background when enabled.
+    """
+    on_commit(lambda: _send(signal, kwargs), using=using)
+
+
+def _send(signal, kwargs):
+    if not is_enabled():
+        signal.send(**kwargs)
+        return
+    if not _workers:
+        _start_workers()
+    _queue.put((signal, kwargs))
+
+
+def wait():
+    """
+    Block until the signals queued so far were sent, for tests and shutdown.
+    """
+    _queue.join()
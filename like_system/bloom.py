@@ -0,0 +1,187 @@
+"""
+Optional per-user Bloom filter of the liked objects, kept in the like cache,
+answering most "has this user liked this object" checks that are false
+without a query. Only the objects the filter may contain are looked up in
+the database.
+
+Enable it along with the like cache::
+
+    LIKE_BLOOM_FILTER = True
+    LIKE_BLOOM_FILTER_ERROR_RATE = 0.01
+    LIKE_BLOOM_FILTER_TIMEOUT = 3600
+
+Likes are added to the filter as they are made. Unlikes are not removed,
+which only costs a query; filters expire after
+``LIKE_BLOOM_FILTER_TIMEOUT`` seconds and are rebuilt from the likes then,
+or as soon as they hold twice the likes they were sized for. Filters
+rebuilt in a transaction, such as the requests of ``ATOMIC_REQUESTS``, are
+not cached.
+"""
+import hashlib
+import math
+
+from django.conf import settings
+from django.utils.encoding import force_bytes, smart_text
+
+from like_system.cache import get_like_cache, make_key
+from like_system.compat import in_transaction
+
+DEFAULT_ERROR_RATE = 0.01
+DEFAULT_TIMEOUT = 60 * 60
+MIN_CAPACITY = 64
+LOCK_TIMEOUT = 5
+
+
+def is_enabled():
+    return getattr(settings, 'LIKE_BLOOM_FILTER', False) and get_like_cache() is not None
+
+
+class BloomFilter(object):
+    """
+    A Bloom filter of ``(content_type_id, object_pk)`` keys sized for
+    ``capacity`` keys at the ``error_rate`` false positive rate.
+    """
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = max(int(capacity), MIN_CAPACITY)
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / float(self.capacity) * math.log(2))))
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def _positions(self, key):
+        # double hashing over the two halves of an md5 digest
+        digest = hashlib.md5(force_bytes('%s:%s' % (key[0], smart_text(key[1])))).hexdigest()
+        h1, h2 = int(digest[:16], 16), int(digest[16:], 16)
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(key))
+
+    @property
+    def is_full(self):
+        return self.count > 2 * self.capacity
+
+    def dumps(self):
+        return (self.capacity, self.error_rate, bytes(self.bits), self.count)
+
+    @classmethod
+    def loads(cls, value):
+        capacity, error_rate, bits, count = value
+        return cls(capacity, error_rate, bits, count)
+
+
+def get_error_rate():
+    return getattr(settings, 'LIKE_BLOOM_FILTER_ERROR_RATE', DEFAULT_ERROR_RATE)
+
+
+def get_timeout():
+    return getattr(settings, 'LIKE_BLOOM_FILTER_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def filter_key(user_id, site_id):
+    return make_key('bloom', 'all', user_id, site_id)
+
+
+def _bump_generation(cache, user_id, site_id):
+    # tells filters being rebuilt that a like was added meanwhile
+    key = filter_key(user_id, site_id) + ':generation'
+    if not cache.add(key, 1, get_timeout()):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.delete(filter_key(user_id, site_id))
+
+
+def build(user_id, site_id):
+    """
+    Build the filter of a user from their likes.
+    """
+    from like_system.models import Like
+
+    keys = Like.objects.filter(user=user_id, site=site_id).order_by().values_list('content_type', 'object_pk')
+    keys = list(keys)
+    bloom = BloomFilter(len(keys), get_error_rate())
+    for key in keys:
+        bloom.add(key)
+    return bloom
+
+
+def get_filter(user_id, site_id):
+    """
+    Return the filter of a user from the cache, rebuilding it when missing.
+    A rebuilt filter is only cached when no like was added while it was
+    built, and never replaces a filter cached meanwhile.
+
+    Filters rebuilt in an open transaction are not cached: its snapshot may
+    miss likes whose ``like_added`` signal was already sent, which happens
+    before the commit on Django versions without commit hooks (see
+    ``like_system.background``).
+    """
+    from like_system.models import Like
+
+    cache = get_like_cache()
+    key = filter_key(user_id, site_id)
+    value = cache.get(key)
+    if value is not None:
+        return BloomFilter.loads(value)
+    generation = cache.get(key + ':generation')
+    bloom = build(user_id, site_id)
+    if cache.get(key + ':generation') == generation and not in_transaction(Like.objects.db):
+        cache.add(key, bloom.dumps(), get_timeout())
+    return bloom
+
+
+def might_contain(user, targets, site):
+    """
+    Return the ``(content_type_id, object_pk)`` targets ``user`` may have
+    liked, dropping those the filter rules out.
+    """
+    bloom = get_filter(getattr(user, 'pk', user), getattr(site, 'pk', site))
+    return [(ctype, object_pk) for ctype, object_pk in targets
+            if (getattr(ctype, 'pk', ctype), smart_text(object_pk)) in bloom]
+
+
+def add(user_id, content_type_id, object_pk, site_id):
+    """
+    Add a like to the cached filter of its user, dropping the filter when it
+    cannot be updated safely or outgrew its size.
+    """
+    if user_id is None or not is_enabled():
+        return
+    cache = get_like_cache()
+    _bump_generation(cache, user_id, site_id)
+    key = filter_key(user_id, site_id)
+    lock = key + ':lock'
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        cache.delete(key)
+        return
+    try:
+        value = cache.get(key)
+        if value is None:
+            return
+        bloom = BloomFilter.loads(value)
+        bloom.add((content_type_id, object_pk))
+        if bloom.is_full:
+            cache.delete(key)
+        else:
+            cache.set(key, bloom.dumps(), get_timeout())
+    finally:
+        cache.delete(lock)
+
+
+def like_added(sender, content_type_id, object_pk, site_id, user_id, **kwargs):
+    add(user_id, content_type_id, object_pk, site_id)
+
+
+def like_saved(sender, instance, **kwargs):
+    # likes saved by the write path are added by the like_added signal, or
+    # by the caller for imports
+    if not getattr(instance, 'sends_like_added', False):
+        add(instance.user_id, instance.content_type_id, instance.object_pk, instance.site_id)
@@ -0,0 +1,162 @@
+"""
+Optional caching of like counts and like lists through Django's cache
+framework.
+
+Enable it by pointing ``LIKE_CACHE_ALIAS`` to one of the ``CACHES``::
+
+    LIKE_CACHE_ALIAS = 'default'
+    LIKE_CACHE_TIMEOUT = 300
+    LIKE_CACHE_KEY_PREFIX = 'like_system'
+
+The cache also tracks the write rate of counters, objects written more than
+``LIKE_COUNTER_HOT_THRESHOLD`` times per ``LIKE_COUNTER_HOT_WINDOW`` seconds
+get their counter spread over ``LIKE_COUNTER_HOT_SHARDS`` shard rows.
+
+Entries are invalidated by the ``post_save``/``post_delete`` signals of the
+like model and by the ``like_added``/``like_removed`` signals of the write
+path, which bypasses ``post_delete``. See ``like_saved``, ``like_deleted``
+and ``like_changed``.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.utils.encoding import force_bytes, smart_text
+
+from like_system import metrics
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_KEY_PREFIX = 'like_system'
+DEFAULT_COUNTER_SHARDS = 1
+DEFAULT_COUNTER_HOT_SHARDS = 16
+DEFAULT_COUNTER_HOT_THRESHOLD = 50
+DEFAULT_COUNTER_HOT_WINDOW = 10
+DEFAULT_COUNTER_HOT_TIMEOUT = 24 * 60 * 60
+
+_caches = {}
+
+
+def get_like_cache():
+    """
+    Returns the cache used for likes, or None when caching is disabled.
+    """
+    alias = getattr(settings, 'LIKE_CACHE_ALIAS', None)
+    if alias is None:
+        return None
+    if alias not in _caches:
+        _caches[alias] = get_cache(alias)
+    return _caches[alias]
+
+
+def get_timeout():
+    return getattr(settings, 'LIKE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def make_key(kind, content_type, object_pk, site):
+    """
+    Build the cache key of a ``kind`` of entry ("count", "list", "rows")
+    for an object. The object pk is hashed to keep keys memcached safe.
+    """
+    return '%s:%s:%s:%s:%s' % (
+        getattr(settings, 'LIKE_CACHE_KEY_PREFIX', DEFAULT_KEY_PREFIX),
+        kind,
+        getattr(site, 'pk', site),
+        getattr(content_type, 'pk', content_type),
+        hashlib.md5(force_bytes(smart_text(object_pk))).hexdigest(),
+    )
+
+
+def get_or_load(kind, content_type, object_pk, site, loader, timeout=None):
+    """
+    Return the cached entry of an object, calling ``loader()`` and caching
+    its result on a miss.
+    """
+    cache = get_like_cache()
+    if cache is None:
+        return loader()
+    key = make_key(kind, content_type, object_pk, site)
+    value = cache.get(key)
+    if value is None:
+        metrics.inc('like_system_cache_requests_total', kind=kind, result='miss')
+        value = loader()
+        cache.set(key, value, timeout or get_timeout())
+    else:
+        metrics.inc('like_system_cache_requests_total', kind=kind, result='hit')
+    return value
+
+
+def get_many_or_load(kind, targets, site, loader):
+    """
+    Return a ``{(content_type_id, object_pk): value}`` dict for many
+    targets, calling ``loader(missing_targets)`` once for the misses.
+    """
+    targets = [(getattr(ctype, 'pk', ctype), smart_text(object_pk)) for ctype, object_pk in targets]
+    cache = get_like_cache()
+    if cache is None:
+        return loader(targets)
+    keys = dict((make_key(kind, ctype, object_pk, site), (ctype, object_pk)) for ctype, object_pk in targets)
+    values = dict((keys[key], value) for key, value in cache.get_many(list(keys)).items())
+    missing = [target for target in targets if target not in values]
+    metrics.inc('like_system_cache_requests_total', len(values), kind=kind, result='hit')
+    metrics.inc('like_system_cache_requests_total', len(missing), kind=kind, result='miss')
+    if missing:
+        loaded = loader(missing)
+        cache.set_many(dict((make_key(kind, ctype, object_pk, site), value)
+                            for (ctype, object_pk), value in loaded.items()), get_timeout())
+        values.update(loaded)
+    return values
+
+
+def invalidate(content_type, object_pk, site):
+    """
+    Drop every cached entry of an object.
+    """
+    cache = get_like_cache()
+    if cache is not None:
+        cache.delete_many([make_key(kind, content_type, object_pk, site) for kind in ('count', 'list', 'rows')])
+
+
+def get_counter_shards(content_type, object_pk, site):
+    """
+    Return the number of counter shards the writes of an object spread over.
+    """
+    default = getattr(settings, 'LIKE_COUNTER_SHARDS', DEFAULT_COUNTER_SHARDS)
+    cache = get_like_cache()
+    if cache is None:
+        return default
+    return cache.get(make_key('shards', content_type, object_pk, site), default)
+
+
+def record_counter_write(content_type, object_pk, site):
+    """
+    Count the counter writes of an object in the current time window and
+    promote it to more shards once it crosses the hot threshold.
+    """
+    cache = get_like_cache()
+    if cache is None:
+        return
+    window = getattr(settings, 'LIKE_COUNTER_HOT_WINDOW', DEFAULT_COUNTER_HOT_WINDOW)
+    key = '%s:%d' % (make_key('writes', content_type, object_pk, site), time.time() // window)
+    if cache.add(key, 1, window * 2):
+        return
+    try:
+        writes = cache.incr(key)
+    except ValueError:
+        return
+    if writes == getattr(settings, 'LIKE_COUNTER_HOT_THRESHOLD', DEFAULT_COUNTER_HOT_THRESHOLD):
+        cache.set(make_key('shards', content_type, object_pk, site),
+                  getattr(settings, 'LIKE_COUNTER_HOT_SHARDS', DEFAULT_COUNTER_HOT_SHARDS),
+                  getattr(settings, 'LIKE_COUNTER_HOT_TIMEOUT', DEFAULT_COUNTER_HOT_TIMEOUT))
+
+
+def like_saved(sender, instance, **kwargs):
+    invalidate(instance.content_type_id, instance.object_pk, instance.site_id)
+
+
+def like_deleted(sender, instance, **kwargs):
+    invalidate(instance.content_type_id, instance.object_pk, instance.site_id)
+
+
+def like_changed(sender, content_type_id, object_pk, site_id, **kwargs):
+    invalidate(content_type_id, object_pk, site_id)
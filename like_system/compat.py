@@ -0,0 +1,60 @@
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+if hasattr(transaction, 'atomic'):
+    atomic = transaction.atomic
+
+    def in_transaction(using=None):
+        """
+        Return whether a transaction is open on the connection, whose writes
+        and snapshot other connections may not see yet.
+        """
+        return connections[using or DEFAULT_DB_ALIAS].in_atomic_block
+else:
+    _depth = threading.local()
+
+    class atomic(object):
+        """
+        Django 1.5 has no ``atomic``. The outermost block falls back to
+        ``commit_on_success`` and nested blocks run in a savepoint, so an
+        error caught around a nested block only rolls back its own statements
+        like on Django 1.6.
+        """
+
+        def __init__(self, using=None):
+            self.using = using or DEFAULT_DB_ALIAS
+
+        def __enter__(self):
+            depth = getattr(_depth, self.using, 0)
+            setattr(_depth, self.using, depth + 1)
+            if depth:
+                self.outer = None
+                self.sid = transaction.savepoint(using=self.using)
+            else:
+                self.outer = transaction.commit_on_success(using=self.using)
+                self.outer.__enter__()
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            setattr(_depth, self.using, getattr(_depth, self.using) - 1)
+            if self.outer is not None:
+                return self.outer.__exit__(exc_type, exc_value, traceback)
+            if exc_type is None:
+                transaction.savepoint_commit(self.sid, using=self.using)
+            else:
+                transaction.savepoint_rollback(self.sid, using=self.using)
+
+    def in_transaction(using=None):
+        return transaction.is_managed(using=using or DEFAULT_DB_ALIAS)
+
+
+if hasattr(transaction, 'on_commit'):
+    on_commit = transaction.on_commit
+else:
+    def on_commit(func, using=None):
+        """
+        Django before 1.9 has no commit hooks: call ``func`` right away, which
+        is before the commit when a transaction is open.
+        """
+        func()
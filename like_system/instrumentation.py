@@ -0,0 +1,142 @@
+"""
+Measures the cost of the like template tags and views: the number of queries,
+the time spent in the database and the wall time of each call.
+
+Measurements are only taken when someone listens:
+
+* the ``operation_measured`` signal of ``like_system.signals`` has receivers,
+* ``LIKE_INSTRUMENTATION_CALLBACK`` names a callable taking a
+  ``Measurement``, e.g. ``'myproject.stats.record_like_operation'``,
+* or a ``capture()`` block is running in the current thread::
+
+    with capture() as measurements:
+        response = client.get('/books/')
+    for measurement in measurements:
+        print(measurement.name, measurement.queries, measurement.db_time)
+
+Queries are counted with the debug cursor of Django, enabled for the duration
+of the measured call only. Measurements nest, a view counting the queries of
+the tags it renders; ``depth`` is 0 for the outermost ones. The wall time also
+feeds the latency histograms of ``like_system.metrics`` when enabled.
+"""
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.utils.importlib import import_module
+
+from like_system import metrics, signals
+
+# ``db_time`` and ``wall_time`` are in seconds, ``depth`` counts the enclosing
+# measurements
+Measurement = namedtuple('Measurement', 'name queries db_time wall_time depth')
+
+_local = threading.local()
+_callbacks = {}
+
+
+def get_callback():
+    """
+    Return the callable named by ``LIKE_INSTRUMENTATION_CALLBACK``, or None.
+    """
+    path = getattr(settings, 'LIKE_INSTRUMENTATION_CALLBACK', None)
+    if not path:
+        return None
+    if path not in _callbacks:
+        module, attr = path.rsplit('.', 1)
+        _callbacks[path] = getattr(import_module(module), attr)
+    return _callbacks[path]
+
+
+def _captures():
+    if not hasattr(_local, 'captures'):
+        _local.captures = []
+    return _local.captures
+
+
+def is_enabled():
+    return bool(_captures() or signals.operation_measured.has_listeners() or get_callback())
+
+
+class instrument(object):
+    """
+    Measure a block or, used as a decorator, every call of a function::
+
+        with instrument('like_count'):
+            ...
+
+        @instrument('like')
+        def like(request, ...):
+            ...
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with instrument(self.name):
+                return func(*args, **kwargs)
+        return inner
+
+    def __enter__(self):
+        self.state = None
+        self.started = time.time()
+        if not is_enabled():
+            return
+        self.depth = getattr(_local, 'depth', 0)
+        _local.depth = self.depth + 1
+        state = []
+        for connection in connections.all():
+            state.append((connection, connection.use_debug_cursor, len(connection.queries)))
+            connection.use_debug_cursor = True
+        self.state = state
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.time() - self.started
+        metrics.observe('like_system_operation_seconds', wall_time, operation=self.name)
+        if self.state is None:
+            return
+        _local.depth = self.depth
+        queries = 0
+        db_time = 0.0
+        for connection, use_debug_cursor, start in self.state:
+            executed = connection.queries[start:]
+            queries += len(executed)
+            db_time += sum(float(query['time']) for query in executed)
+            connection.use_debug_cursor = use_debug_cursor
+            if not settings.DEBUG and not use_debug_cursor:
+                # the queries log is only kept in debug mode, or while an
+                # enclosing measurement or test still counts them
+                del connection.queries[start:]
+        record(Measurement(self.name, queries, db_time, wall_time, self.depth))
+
+
+def record(measurement):
+    """
+    Hand a measurement to the running captures, the signal and the callback.
+    """
+    for measurements in _captures():
+        measurements.append(measurement)
+    signals.operation_measured.send(sender=None, measurement=measurement)
+    callback = get_callback()
+    if callback is not None:
+        callback(measurement)
+
+
+@contextmanager
+def capture():
+    """
+    Collect the measurements taken in the current thread within the block.
+    """
+    measurements = []
+    _captures().append(measurements)
+    try:
+        yield measurements
+    finally:
+        _local.captures = [captured for captured in _captures() if captured is not measurements]
@@ -0,0 +1,217 @@
+"""
+Leaderboard of the most popular liked objects, with exponential time decay.
+
+Every like adds ``exp(t / tau)`` to the score of an object, ``t`` being the
+time of the like and ``tau`` derived from ``LIKE_LEADERBOARD_HALF_LIFE``
+(seconds, one day by default); an unlike subtracts the weight its like
+added at its submit date, so a like and its unlike cancel out. When the
+submit date is unknown (see ``like_system.signals``), it subtracts the mean
+weight of the likes of the object instead. Compared at any moment, scores
+decay by the same factor, so their order only changes when an object is
+liked or unliked: each like is an O(log n) update of the ``(content_type,
+site, hot)`` index and reading the top objects never aggregates or re-sorts
+the likes. Scores are stored as their logarithm ("hot") so they never
+overflow.
+
+Each process also keeps the ``LIKE_LEADERBOARD_SIZE`` best objects of every
+content type in memory, patched by the likes of the process and reloaded
+from the database every ``LIKE_LEADERBOARD_REFRESH`` seconds.
+
+Set ``LIKE_LEADERBOARD = False`` to stop maintaining the scores.
+"""
+import bisect
+import calendar
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from django.utils.encoding import smart_text
+
+DEFAULT_HALF_LIFE = 24 * 60 * 60
+DEFAULT_SIZE = 100
+DEFAULT_REFRESH = 60
+
+_leaderboards = {}
+_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'LIKE_LEADERBOARD', True)
+
+
+def like_weight(submit_date):
+    """
+    Return the logarithm of the weight of a like made at ``submit_date``.
+    Microseconds are dropped, as some databases do not store them.
+    """
+    if timezone.is_naive(submit_date):
+        submit_date = timezone.make_aware(submit_date, timezone.get_default_timezone())
+    half_life = getattr(settings, 'LIKE_LEADERBOARD_HALF_LIFE', DEFAULT_HALF_LIFE)
+    return calendar.timegm(submit_date.utctimetuple()) * math.log(2) / half_life
+
+
+def current_weight():
+    """
+    Return the logarithm of the weight of a like made now.
+    """
+    return like_weight(timezone.now())
+
+
+class Leaderboard(object):
+    """
+    The best scored objects of a content type on a site, kept in memory.
+    """
+
+    def __init__(self, content_type_id, site_id):
+        self.content_type_id = content_type_id
+        self.site_id = site_id
+        self.loaded_at = None
+        self.entries = []
+        self.scores = {}
+        self.objects = {}
+
+    @property
+    def size(self):
+        return getattr(settings, 'LIKE_LEADERBOARD_SIZE', DEFAULT_SIZE)
+
+    def is_stale(self):
+        refresh = getattr(settings, 'LIKE_LEADERBOARD_REFRESH', DEFAULT_REFRESH)
+        return self.loaded_at is None or time.time() - self.loaded_at > refresh
+
+    def load(self):
+        """
+        Replace the entries with a snapshot of the best scores.
+        """
+        from like_system.models import LikeScore
+
+        top = LikeScore.objects.top(self.content_type_id, self.size, self.site_id)
+        self.entries = sorted(top)
+        self.scores = dict((object_pk, hot) for hot, object_pk in top)
+        self.objects = {}
+        self.loaded_at = time.time()
+
+    def update(self, object_pk, hot):
+        """
+        Move an object to its new score, ``None`` removing it.
+        """
+        old = self.scores.pop(object_pk, None)
+        if old is not None:
+            del self.entries[bisect.bisect_left(self.entries, (old, object_pk))]
+        if hot is None:
+            return
+        if len(self.entries) >= self.size and (hot, object_pk) < self.entries[0]:
+            return
+        bisect.insort(self.entries, (hot, object_pk))
+        self.scores[object_pk] = hot
+        if len(self.entries) > self.size:
+            hot, object_pk = self.entries.pop(0)
+            del self.scores[object_pk]
+
+    def top(self, n):
+        """
+        Return the object pks of the ``n`` best scored objects.
+        """
+        return [object_pk for hot, object_pk in reversed(self.entries[-n:])] if n > 0 else []
+
+    def top_objects(self, n):
+        """
+        Return the ``n`` best scored objects, loading the objects not seen yet
+        with a single query.
+        """
+        object_pks = self.top(n)
+        missing = [object_pk for object_pk in object_pks if object_pk not in self.objects]
+        if missing:
+            content_type = ContentType.objects.get_for_id(self.content_type_id)
+            for obj in content_type.get_all_objects_for_this_type(pk__in=missing):
+                self.objects[smart_text(obj.pk)] = obj
+        return [self.objects[object_pk] for object_pk in object_pks if object_pk in self.objects]
+
+
+def get_leaderboard(content_type_id, site_id):
+    key = (content_type_id, site_id)
+    leaderboard = _leaderboards.get(key)
+    if leaderboard is None:
+        leaderboard = _leaderboards.setdefault(key, Leaderboard(content_type_id, site_id))
+    return leaderboard
+
+
+def top_liked(content_type, n, site):
+    """
+    Return the ``n`` most popular objects of a content type on a site.
+    """
+    leaderboard = get_leaderboard(getattr(content_type, 'pk', content_type), getattr(site, 'pk', site))
+    with _lock:
+        if leaderboard.is_stale():
+            leaderboard.load()
+        return leaderboard.top_objects(n)
+
+
+def mean_weight(content_type_id, object_pk, site_id):
+    """
+    Return the logarithm of the mean weight of the likes of an object, the
+    weight of an unliked like whose submit date is unknown, or None when
+    the object has no score. Called after the counter of the unlike moved.
+    """
+    from like_system.models import LikeCounter, LikeScore
+
+    scores = LikeScore.objects.filter(content_type=content_type_id, object_pk=object_pk,
+                                      site=site_id).values_list('hot', flat=True)[:1]
+    if not scores:
+        return None
+    remaining = LikeCounter.objects.get_count(content_type_id, object_pk, site_id)
+    return scores[0] - math.log(remaining + 1)
+
+
+def _record(content_type_id, object_pk, site_id, submit_date, sign):
+    if not is_enabled():
+        return
+    object_pk = smart_text(object_pk)
+    if submit_date is not None:
+        weight = like_weight(submit_date)
+    elif sign > 0:
+        weight = current_weight()
+    else:
+        weight = mean_weight(content_type_id, object_pk, site_id)
+        if weight is None:
+            return
+    _add_weight(content_type_id, object_pk, site_id, weight, sign)
+
+
+def add_likes(likes):
+    """
+    Add the weights of many likes, given as ``(content_type_id, object_pk,
+    site_id, submit_date)`` tuples, with one score update per object. For
+    imports, which send no ``like_added`` signals.
+    """
+    from like_system.managers import log_add
+
+    if not is_enabled():
+        return
+    weights = {}
+    for content_type_id, object_pk, site_id, submit_date in likes:
+        key = (content_type_id, smart_text(object_pk), site_id)
+        weight = like_weight(submit_date) if submit_date is not None else current_weight()
+        weights[key] = log_add(weights[key], weight) if key in weights else weight
+    for (content_type_id, object_pk, site_id), weight in weights.items():
+        _add_weight(content_type_id, object_pk, site_id, weight, 1)
+
+
+def _add_weight(content_type_id, object_pk, site_id, weight, sign):
+    from like_system.models import LikeScore
+
+    hot = LikeScore.objects.add_weight(content_type_id, object_pk, site_id, weight, sign)
+    leaderboard = _leaderboards.get((content_type_id, site_id))
+    if leaderboard is not None and leaderboard.loaded_at is not None:
+        with _lock:
+            leaderboard.update(object_pk, hot)
+
+
+def like_added(sender, content_type_id, object_pk, site_id, submit_date=None, **kwargs):
+    _record(content_type_id, object_pk, site_id, submit_date, 1)
+
+
+def like_removed(sender, content_type_id, object_pk, site_id, submit_date=None, **kwargs):
+    _record(content_type_id, object_pk, site_id, submit_date, -1)
@@ -0,0 +1,67 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import get_current_site
+from django.utils.encoding import smart_text
+
+from like_system.backends import get_backend
+
+
+class LikedSet(object):
+    """
+    Answers "has the user liked this object" for the lifetime of a request.
+
+    Objects passed to ``preload`` are looked up with a single ``IN`` query,
+    every later check for them is answered from memory.
+    """
+
+    def __init__(self, user, site):
+        self.user = user
+        self.site = site
+        self._liked = {}
+
+    @property
+    def is_anonymous(self):
+        return self.user is None or not self.user.is_authenticated()
+
+    def preload(self, targets):
+        """
+        Load the liked state of many ``(content_type, object_pk)`` pairs.
+        """
+        keys = set((getattr(ctype, 'pk', ctype), smart_text(object_pk)) for ctype, object_pk in targets)
+        keys.difference_update(self._liked)
+        if not keys:
+            return
+        if self.is_anonymous:
+            liked = set()
+        else:
+            liked = get_backend().bulk_exists(self.user, keys, self.site)
+        for key in keys:
+            self._liked[key] = key in liked
+
+    def preload_objects(self, objects):
+        self.preload((ContentType.objects.get_for_model(obj), obj.pk) for obj in objects)
+
+    def liked(self, content_type, object_pk):
+        key = (getattr(content_type, 'pk', content_type), smart_text(object_pk))
+        if key not in self._liked:
+            self.preload([key])
+        return self._liked[key]
+
+
+def get_liked_set(context):
+    """
+    Return the ``LikedSet`` of the current user, shared by every template
+    rendered for the request (or by the current render without a request).
+    """
+    request = context.get('request')
+    if request is not None:
+        liked_set = getattr(request, '_like_system_liked_set', None)
+        if liked_set is None:
+            liked_set = LikedSet(getattr(request, 'user', None), get_current_site(request).pk)
+            request._like_system_liked_set = liked_set
+        return liked_set
+
+    liked_set = context.render_context.get('like_system_liked_set')
+    if liked_set is None:
+        liked_set = LikedSet(context.get('user'), get_current_site(context).pk)
+        context.render_context['like_system_liked_set'] = liked_set
+    return liked_set
@@ -0,0 +1,170 @@
+"""
+Per-user index of the liked objects of a content type, answering "has this
+user liked these objects" from the like cache without a query.
+
+The index of a user is the sorted list of the pks of the objects they
+liked, stored in the cache packed as little-endian 64 bit integers (8 bytes
+per like) and searched by bisection. It is built from the likes on the
+first lookup and patched when likes are added or removed. Objects with non
+integer pks are looked up with a query as before.
+
+Enabled with the like cache (``LIKE_CACHE_ALIAS``) unless
+``LIKE_LIKED_INDEX = False``; entries expire after
+``LIKE_LIKED_INDEX_TIMEOUT`` seconds, which bounds how long a like racing
+with the rebuild of its index can be missed.
+"""
+import bisect
+import struct
+
+from django.conf import settings
+from django.utils.encoding import smart_text
+
+from like_system.cache import get_like_cache, make_key
+
+DEFAULT_TIMEOUT = 300
+LOCK_TIMEOUT = 5
+
+
+def is_enabled():
+    return get_like_cache() is not None and getattr(settings, 'LIKE_LIKED_INDEX', True)
+
+
+def get_timeout():
+    return getattr(settings, 'LIKE_LIKED_INDEX_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def index_key(user_id, content_type_id, site_id):
+    return make_key('liked', content_type_id, user_id, site_id)
+
+
+def to_bytes(ids):
+    return struct.pack('<%dq' % len(ids), *ids)
+
+
+def from_bytes(data):
+    return list(struct.unpack('<%dq' % (len(data) // 8), data))
+
+
+def _int_pk(object_pk):
+    try:
+        return int(object_pk)
+    except (TypeError, ValueError):
+        return None
+
+
+def contains(ids, pk):
+    i = bisect.bisect_left(ids, pk)
+    return i < len(ids) and ids[i] == pk
+
+
+def build_indexes(user_id, content_type_ids, site_id):
+    """
+    Return ``{content_type_id: ids}`` read from the likes of a user, ``ids``
+    being None for content types with non integer pks.
+    """
+    from like_system.models import Like
+
+    pks = dict((ctype_id, []) for ctype_id in content_type_ids)
+    likes = Like.objects.filter(user=user_id, site=site_id, content_type__in=content_type_ids) \
+        .order_by().values_list('content_type', 'object_pk')
+    for ctype_id, object_pk in likes:
+        if pks[ctype_id] is not None:
+            pk = _int_pk(object_pk)
+            pks[ctype_id] = None if pk is None else pks[ctype_id] + [pk]
+    return dict((ctype_id, None if values is None else sorted(values))
+                for ctype_id, values in pks.items())
+
+
+def get_indexes(user_id, content_type_ids, site_id):
+    """
+    Return ``{content_type_id: ids}`` from the cache, building the missing
+    indexes with a single query.
+    """
+    cache = get_like_cache()
+    keys = dict((index_key(user_id, ctype_id, site_id), ctype_id) for ctype_id in content_type_ids)
+    indexes = {}
+    for key, value in cache.get_many(list(keys)).items():
+        supported, data = value
+        indexes[keys[key]] = from_bytes(data) if supported else None
+    missing = [ctype_id for ctype_id in content_type_ids if ctype_id not in indexes]
+    if missing:
+        built = build_indexes(user_id, missing, site_id)
+        cache.set_many(dict((index_key(user_id, ctype_id, site_id),
+                             (False, b'') if ids is None else (True, to_bytes(ids)))
+                            for ctype_id, ids in built.items()), get_timeout())
+        indexes.update(built)
+    return indexes
+
+
+def lookup(user, targets, site):
+    """
+    Answer which of the ``(content_type, object_pk)`` targets ``user`` liked
+    from the indexes. Returns the set of liked ``(content_type_id,
+    object_pk)`` keys and the targets the indexes cannot answer.
+    """
+    user_id = getattr(user, 'pk', user)
+    site_id = getattr(site, 'pk', site)
+    targets = [(getattr(ctype, 'pk', ctype), smart_text(object_pk)) for ctype, object_pk in targets]
+    indexes = get_indexes(user_id, set(ctype_id for ctype_id, object_pk in targets), site_id)
+    liked = set()
+    remaining = []
+    for ctype_id, object_pk in targets:
+        ids = indexes[ctype_id]
+        pk = _int_pk(object_pk)
+        if ids is None or pk is None:
+            remaining.append((ctype_id, object_pk))
+        elif contains(ids, pk):
+            liked.add((ctype_id, object_pk))
+    return liked, remaining
+
+
+def patch(user_id, content_type_id, object_pk, site_id, liked):
+    """
+    Add or remove an object in the cached index of a user, dropping the
+    index when it cannot be patched safely.
+    """
+    if user_id is None or not is_enabled():
+        return
+    cache = get_like_cache()
+    key = index_key(user_id, content_type_id, site_id)
+    pk = _int_pk(object_pk)
+    lock = key + ':lock'
+    if pk is None or not cache.add(lock, 1, LOCK_TIMEOUT):
+        cache.delete(key)
+        return
+    try:
+        value = cache.get(key)
+        if value is None or not value[0]:
+            return
+        ids = from_bytes(value[1])
+        i = bisect.bisect_left(ids, pk)
+        present = i < len(ids) and ids[i] == pk
+        if liked and not present:
+            ids.insert(i, pk)
+        elif not liked and present:
+            ids.pop(i)
+        else:
+            return
+        cache.set(key, (True, to_bytes(ids)), get_timeout())
+    finally:
+        cache.delete(lock)
+
+
+def like_added(sender, content_type_id, object_pk, site_id, user_id, **kwargs):
+    patch(user_id, content_type_id, object_pk, site_id, True)
+
+
+def like_removed(sender, content_type_id, object_pk, site_id, user_id, **kwargs):
+    patch(user_id, content_type_id, object_pk, site_id, False)
+
+
+def like_saved(sender, instance, created, **kwargs):
+    if created:
+        patch(instance.user_id, instance.content_type_id, instance.object_pk, instance.site_id, True)
+    elif instance.user_id is not None and is_enabled():
+        # the like may have moved to another object
+        get_like_cache().delete(index_key(instance.user_id, instance.content_type_id, instance.site_id))
+
+
+def like_deleted(sender, instance, **kwargs):
+    patch(instance.user_id, instance.content_type_id, instance.object_pk, instance.site_id, False)
@@ -0,0 +1,44 @@
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.utils import timezone
+
+from like_system.compat import atomic
+from like_system.managers import hour_bucket
+from like_system.models import Like, LikeBucket
+
+
+class Command(NoArgsCommand):
+    help = "Rebuilds the hourly like buckets of the trending lists from the likes."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--days', type='int', dest='days', default=None,
+                    help='Only rebuild the buckets of the last DAYS days.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+                    help='Number of buckets inserted per query.'),
+    )
+
+    def handle_noargs(self, **options):
+        likes = Like.objects.order_by()
+        buckets = LikeBucket.objects.all()
+        if options['days']:
+            since = hour_bucket(timezone.now() - timedelta(days=options['days']))
+            likes = likes.filter(submit_date__gte=since)
+            buckets = buckets.filter(bucket__gte=since)
+
+        counts = {}
+        for ctype_id, object_pk, site_id, submit_date in likes.values_list(
+                'content_type', 'object_pk', 'site', 'submit_date').iterator():
+            key = (ctype_id, object_pk, site_id, hour_bucket(submit_date))
+            counts[key] = counts.get(key, 0) + 1
+
+        with atomic():
+            buckets.delete()
+            LikeBucket.objects.bulk_create([
+                LikeBucket(content_type_id=ctype_id, object_pk=object_pk, site_id=site_id, bucket=bucket, count=count)
+                for (ctype_id, object_pk, site_id, bucket), count in counts.items()
+            ], batch_size=options['batch_size'])
+
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Rebuilt %d like buckets from %d likes" % (len(counts), sum(counts.values())))
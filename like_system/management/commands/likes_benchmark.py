@@ -0,0 +1,177 @@
+import json
+import platform
+import time
+from datetime import timedelta
+from optparse import make_option
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import CommandError, NoArgsCommand
+from django.db import connection
+from django.db.models import get_model
+from django.template import Context, Template
+from django.test.client import RequestFactory
+from django.utils import timezone
+
+from like_system import views
+from like_system.models import Like, LikeCounter
+
+
+def summarize(durations, queries):
+    durations = sorted(durations)
+    n = len(durations)
+    return {
+        'n': n,
+        'mean_ms': round(sum(durations) / n * 1000, 3),
+        'median_ms': round(durations[n // 2] * 1000, 3),
+        'p95_ms': round(durations[min(n - 1, int(n * 0.95))] * 1000, 3),
+        'min_ms': round(durations[0] * 1000, 3),
+        'queries': round(float(sum(queries)) / n, 2),
+    }
+
+
+class Command(NoArgsCommand):
+    help = ("Seeds a test database with example books and likes and times the like views and "
+            "template tags, printing the results as JSON.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--likes', type='int', dest='likes', default=1000,
+                    help='Number of likes to seed, 1000 to 1000000.'),
+        make_option('--books', type='int', dest='books', default=100,
+                    help='Number of books the likes are spread over.'),
+        make_option('--repeat', type='int', dest='repeat', default=100,
+                    help='Number of timed runs of each operation.'),
+        make_option('--label', dest='label', default='',
+                    help='Label stored with the results, e.g. a commit hash.'),
+        make_option('--output', '-o', dest='output', default=None,
+                    help='File to write the results to, standard output by default.'),
+    )
+
+    def handle_noargs(self, **options):
+        if get_model('example', 'book') is None:
+            raise CommandError("The benchmark needs the example app in INSTALLED_APPS.")
+        if options['likes'] < 1 or options['books'] < 1 or options['repeat'] < 1:
+            raise CommandError("--likes, --books and --repeat must be positive.")
+
+        # never touch the configured database
+        if 'south' in settings.INSTALLED_APPS:
+            from south.management.commands import patch_for_test_db_setup
+            patch_for_test_db_setup()
+        old_name = settings.DATABASES[connection.alias]['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            started = time.time()
+            self.seed(options['likes'], options['books'])
+            seed_seconds = time.time() - started
+            results = self.run(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = json.dumps({
+            'label': options['label'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cache': getattr(settings, 'LIKE_CACHE_ALIAS', None),
+            'likes': options['likes'],
+            'books': options['books'],
+            'seed_seconds': round(seed_seconds, 3),
+            'operations': results,
+        }, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    def seed(self, likes, books, batch_size=500):
+        """
+        Insert ``books`` books and ``likes`` likes spread evenly over them,
+        with their counters.
+        """
+        Author = get_model('example', 'author')
+        Book = get_model('example', 'book')
+        User = get_user_model()
+
+        author = Author.objects.create(name='Author')
+        Book.objects.bulk_create([Book(name='Book %d' % i, iban=str(i), author=author) for i in range(books)],
+                                 batch_size=batch_size)
+        self.books = list(Book.objects.order_by('pk'))
+        users = (likes + books - 1) // books + 1
+        password = make_password(None)
+        User.objects.bulk_create([User(**{User.USERNAME_FIELD: 'user%d' % i, 'password': password})
+                                  for i in range(users)], batch_size=batch_size)
+        self.users = list(User.objects.order_by('pk'))
+
+        ctype_id = ContentType.objects.get_for_model(Book).pk
+        now = timezone.now()
+        batch = []
+        for i in range(likes):
+            book = self.books[i % books]
+            batch.append(Like(content_type_id=ctype_id, object_pk=str(book.pk), site_id=settings.SITE_ID,
+                              user=self.users[i // books], submit_date=now - timedelta(seconds=i)))
+            if len(batch) == batch_size:
+                Like.objects.bulk_create(batch)
+                batch = []
+        Like.objects.bulk_create(batch)
+        LikeCounter.objects.bulk_create([
+            LikeCounter(content_type_id=ctype_id, object_pk=str(book.pk), site_id=settings.SITE_ID,
+                        count=likes // books + (1 if i < likes % books else 0))
+            for i, book in enumerate(self.books)
+        ], batch_size=batch_size)
+
+    def run(self, repeat):
+        """
+        Time every operation ``repeat`` times, on the most liked book, by the
+        user kept free of likes for that purpose.
+        """
+        factory = RequestFactory()
+        book = self.books[0]
+        user = self.users[-1]
+
+        def request(path='/'):
+            request = factory.get(path)
+            request.user = user
+            return request
+
+        def view(func):
+            return lambda: func(request(), content_type='example.book', object_pk=str(book.pk))
+
+        def tag(source):
+            template = Template('{% load likes %}' + source)
+            return lambda: template.render(Context({'book': book, 'user': user, 'request': request()}))
+
+        operations = [
+            ('like', view(views.like)),
+            ('unlike', view(views.unlike)),
+            ('get_like_count', tag('{% get_like_count for book as n %}')),
+            ('get_like_list', tag('{% get_like_list for book as likes %}{% for like in likes %}{{ like }}{% endfor %}')),
+            ('get_like_list_page', tag('{% get_like_list for book limit 20 as likes %}'
+                                       '{% for like in likes %}{{ like }}{% endfor %}')),
+            ('get_like_list_rows', tag('{% get_like_list for book rows limit 20 as likes %}'
+                                       '{% for like in likes %}{{ like }}{% endfor %}')),
+            ('liked_this', tag('{% liked_this for book as liked %}')),
+        ]
+        timings = dict((name, ([], [])) for name, func in operations)
+        for i in range(repeat):
+            # like and unlike alternate so every run sees the same data
+            for name, func in operations:
+                durations, queries = timings[name]
+                # count the queries with the debug cursor, as CaptureQueriesContext
+                # only exists from Django 1.6
+                use_debug_cursor = connection.use_debug_cursor
+                connection.use_debug_cursor = True
+                start = len(connection.queries)
+                try:
+                    started = time.time()
+                    func()
+                    durations.append(time.time() - started)
+                    queries.append(len(connection.queries) - start)
+                finally:
+                    connection.use_debug_cursor = use_debug_cursor
+                    if not settings.DEBUG and not use_debug_cursor:
+                        del connection.queries[start:]
+        return dict((name, summarize(*timings[name])) for name, func in operations)
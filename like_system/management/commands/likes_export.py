@@ -0,0 +1,84 @@
+import time
+from optparse import make_option
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.management.base import CommandError, NoArgsCommand, OutputWrapper
+
+from like_system.models import Like
+from like_system.resolvers import get_content_type_token, resolve_content_type
+from like_system.transfer import dump_row, guess_format, header, open_output
+
+
+class Command(NoArgsCommand):
+    help = "Exports likes as JSON lines or CSV, to standard output or a file."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--output', '-o', dest='output', default=None,
+                    help='File to write, standard output by default.'),
+        make_option('--format', dest='format', default=None,
+                    help='jsonl or csv, guessed from the output file name by default.'),
+        make_option('--content-type', dest='content_type', default=None,
+                    help='Only export the likes of this app_label.model.'),
+        make_option('--chunk-size', type='int', dest='chunk_size', default=5000,
+                    help='Number of likes read per query.'),
+    )
+
+    def handle_noargs(self, **options):
+        try:
+            format = guess_format(options['output'], options['format'])
+        except ValueError as e:
+            raise CommandError(e)
+        verbosity = int(options.get('verbosity', 1))
+        chunk_size = options['chunk_size']
+
+        # references are resolved once, not joined on every row
+        content_types = dict((ct.pk, get_content_type_token(ct)) for ct in ContentType.objects.all())
+        domains = dict(Site.objects.values_list('pk', 'domain'))
+
+        likes = Like.objects.order_by('pk')
+        if options['content_type']:
+            try:
+                likes = likes.filter(content_type=resolve_content_type(options['content_type']))
+            except ContentType.DoesNotExist:
+                raise CommandError("Unknown content type %r" % options['content_type'])
+        likes = likes.values_list('pk', 'content_type', 'object_pk', 'site',
+                                  'user__%s' % get_user_model().USERNAME_FIELD, 'submit_date')
+
+        output = OutputWrapper(open_output(options['output'])) if options['output'] else self.stdout
+        started = time.time()
+        exported = 0
+        last_pk = 0
+        try:
+            output.write(header(format), ending='')
+            while True:
+                # chunks are read by primary key range, so each query only
+                # holds one chunk however large the table is
+                read = 0
+                for pk, ctype_id, object_pk, site_id, username, submit_date in \
+                        likes.filter(pk__gt=last_pk)[:chunk_size].iterator():
+                    output.write(dump_row(format, {
+                        'content_type': content_types[ctype_id],
+                        'object_pk': object_pk,
+                        'site': domains[site_id],
+                        'user': username,
+                        'submit_date': submit_date,
+                    }), ending='')
+                    last_pk = pk
+                    read += 1
+                exported += read
+                if verbosity > 1:
+                    self.report(exported, started)
+                if read < chunk_size:
+                    break
+        finally:
+            if options['output']:
+                output.close()
+
+        if verbosity > 0:
+            self.report(exported, started)
+
+    def report(self, exported, started):
+        elapsed = max(time.time() - started, 1e-6)
+        self.stderr.write("Exported %d likes in %.1fs (%d rows/s)" % (exported, elapsed, exported / elapsed))
@@ -0,0 +1,28 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from like_system.models import PendingLike
+
+
+class Command(NoArgsCommand):
+    help = "Applies the likes and unlikes queued by the write-behind mode (LIKE_WRITE_BEHIND)."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+                    help='Number of queued operations applied per transaction.'),
+        make_option('--interval', type='float', dest='interval', default=None,
+                    help='Keep running and flush every INTERVAL seconds.'),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        while True:
+            started = time.time()
+            flushed = PendingLike.objects.flush(options['batch_size'])
+            if verbosity > 0 and (flushed or not options['interval']):
+                self.stdout.write("Flushed %d queued like operations in %.2fs" % (flushed, time.time() - started))
+            if not options['interval']:
+                break
+            time.sleep(max(options['interval'] - (time.time() - started), 0))
@@ -0,0 +1,110 @@
+import time
+from itertools import islice
+from optparse import make_option
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.encoding import smart_text
+
+from like_system import bloom, leaderboard, liked_index
+from like_system import cache as like_cache
+from like_system.managers import LIKE, LikeOperation
+from like_system.models import Like
+from like_system.resolvers import get_content_type_token
+from like_system.transfer import guess_format, load_rows, open_input, parse_submit_date
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = ("Imports likes exported by likes_export, from a file or standard input (-). "
+            "Likes that already exist are skipped.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default=None,
+                    help='jsonl or csv, guessed from the file name by default.'),
+        make_option('--chunk-size', type='int', dest='chunk_size', default=500,
+                    help='Number of likes inserted per transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Give the file to import, or - for standard input.")
+        path = args[0]
+        try:
+            format = guess_format(path, options['format'])
+        except ValueError as e:
+            raise CommandError(e)
+        verbosity = int(options.get('verbosity', 1))
+
+        # references are resolved once instead of once per row
+        self.content_types = dict((get_content_type_token(ct), ct.pk) for ct in ContentType.objects.all())
+        self.sites = dict(Site.objects.values_list('domain', 'pk'))
+        self.user_model = get_user_model()
+
+        started = time.time()
+        totals = {'read': 0, 'imported': 0, 'skipped': 0, 'invalid': 0}
+        lines = open_input(path)
+        try:
+            rows = load_rows(format, lines)
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                imported, invalid = self.import_chunk(chunk)
+                totals['read'] += len(chunk)
+                totals['imported'] += imported
+                totals['invalid'] += invalid
+                totals['skipped'] += len(chunk) - imported - invalid
+                if verbosity > 1:
+                    self.report(totals, started)
+        except ValueError as e:
+            raise CommandError("Line %d is malformed: %s" % (totals['read'] + 1, e))
+        finally:
+            if path != '-':
+                lines.close()
+
+        if verbosity > 0:
+            self.report(totals, started)
+
+    def import_chunk(self, chunk):
+        """
+        Insert the likes of a chunk in one transaction. Returns the number of
+        likes imported and of rows that could not be resolved.
+        """
+        username_field = self.user_model.USERNAME_FIELD
+        usernames = set(row.get('user') for row in chunk if row.get('user'))
+        users = dict(self.user_model._default_manager.filter(**{'%s__in' % username_field: usernames})
+                     .values_list(username_field, 'pk'))
+
+        operations = []
+        for row in chunk:
+            try:
+                operations.append(LikeOperation(LIKE,
+                                                self.content_types[row['content_type']],
+                                                smart_text(row['object_pk']),
+                                                self.sites[row['site']],
+                                                users[row['user']],
+                                                parse_submit_date(row['submit_date'])))
+            except (KeyError, ValueError):
+                continue
+
+        # no per-like signals, the cached entries of the objects are dropped
+        # once below, the scores updated once per object and the likes added
+        # to the liked indexes and Bloom filters of their users
+        changed = Like.objects.bulk_apply(operations, send_signals=False)
+        imported = [op for op, op_changed in zip(operations, changed) if op_changed]
+        for ctype_id, object_pk, site_id in set(op[1:4] for op in imported):
+            like_cache.invalidate(ctype_id, object_pk, site_id)
+        leaderboard.add_likes((op.content_type_id, op.object_pk, op.site_id, op.submit_date) for op in imported)
+        for op in imported:
+            liked_index.patch(op.user_id, op.content_type_id, op.object_pk, op.site_id, True)
+            bloom.add(op.user_id, op.content_type_id, op.object_pk, op.site_id)
+        return sum(changed), len(chunk) - len(operations)
+
+    def report(self, totals, started):
+        elapsed = max(time.time() - started, 1e-6)
+        self.stderr.write("Read %(read)d likes: %(imported)d imported, %(skipped)d already present, "
+                          "%(invalid)d unresolved" % totals +
+                          " in %.1fs (%d rows/s)" % (elapsed, totals['read'] / elapsed))
@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+from optparse import make_option
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import CommandError, NoArgsCommand
+from django.db import connections
+
+from like_system.models import Like, LikeCounter
+from like_system.resolvers import get_content_type_token, resolve_content_type
+
+
+def recount_partition(partition):
+    """
+    Recount one ``(content_type_id, lower, upper, dry_run)`` partition, in a
+    worker process.
+    """
+    ctype_id, lower, upper, dry_run = partition
+    return partition, LikeCounter.objects.recount(ctype_id, lower, upper, dry_run=dry_run)
+
+
+def close_connections():
+    # forked workers must not share the sockets of the parent
+    for connection in connections.all():
+        connection.close()
+
+
+class Command(NoArgsCommand):
+    help = ("Recounts the like counters from the likes and corrects those that drifted. "
+            "Safe to run while likes are written.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+                    help='Report the drifted counters without correcting them.'),
+        make_option('--processes', type='int', dest='processes', default=multiprocessing.cpu_count(),
+                    help='Number of worker processes, 1 to recount in this process.'),
+        make_option('--partitions', type='int', dest='partitions', default=8,
+                    help='Number of object pk ranges each content type is split into.'),
+        make_option('--content-type', dest='content_type', default=None,
+                    help='Only recount the counters of this app_label.model.'),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        if options['content_type']:
+            try:
+                ctype_ids = [resolve_content_type(options['content_type']).pk]
+            except ContentType.DoesNotExist:
+                raise CommandError("Unknown content type %r" % options['content_type'])
+        else:
+            ctype_ids = sorted(set(Like.objects.order_by().values_list('content_type', flat=True).distinct()) |
+                               set(LikeCounter.objects.order_by().values_list('content_type', flat=True).distinct()))
+
+        partitions = [(ctype_id, lower, upper, options['dry_run'])
+                      for ctype_id in ctype_ids
+                      for lower, upper in self.get_ranges(ctype_id, max(options['partitions'], 1))]
+        tokens = dict((ctype_id, get_content_type_token(ContentType.objects.get_for_id(ctype_id)))
+                      for ctype_id in ctype_ids)
+
+        started = time.time()
+        pool = None
+        if options['processes'] > 1 and len(partitions) > 1:
+            close_connections()
+            pool = multiprocessing.Pool(min(options['processes'], len(partitions)))
+            results = pool.imap_unordered(recount_partition, partitions)
+        else:
+            results = (recount_partition(partition) for partition in partitions)
+
+        drifted = 0
+        try:
+            for done, ((ctype_id, lower, upper, dry_run), deltas) in enumerate(results, 1):
+                drifted += len(deltas)
+                if verbosity > 0:
+                    self.stdout.write("[%d/%d] %s [%s, %s): %d counters %s" % (
+                        done, len(partitions), tokens[ctype_id], lower or '', upper or '',
+                        len(deltas), 'off' if dry_run else 'corrected'))
+                if verbosity > 1:
+                    for (ctype_id, object_pk, site_id), delta in sorted(deltas.items()):
+                        self.stdout.write("  %s %s on site %s: %+d" % (tokens[ctype_id], object_pk, site_id, delta))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if verbosity > 0:
+            self.stdout.write("%d counters %s in %.1fs" % (
+                drifted, 'off' if options['dry_run'] else 'corrected', time.time() - started))
+
+    def get_ranges(self, ctype_id, partitions):
+        """
+        Split the object pks of a content type in ``partitions`` ranges of
+        about as many likes, the first and last ranges being open.
+        """
+        object_pks = Like.objects.filter(content_type=ctype_id).order_by('object_pk') \
+            .values_list('object_pk', flat=True)
+        total = object_pks.count()
+        bounds = sorted(set(object_pks[total * i // partitions] for i in range(1, partitions))) if total else []
+        edges = [None] + bounds + [None]
+        return list(zip(edges[:-1], edges[1:]))
@@ -0,0 +1,766 @@
+import math
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, connections, models
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible, smart_text
+
+from like_system import background, signals
+from like_system import cache as like_cache
+from like_system.compat import atomic
+
+
+def _pk(value):
+    """Accept either a model instance or its primary key."""
+    return getattr(value, 'pk', value)
+
+
+def _targets_q(targets):
+    """
+    Build a filter matching ``(content_type, object_pk)`` pairs, with one
+    ``IN`` clause per content type. Returns None for no targets.
+    """
+    pks_by_ctype = {}
+    for content_type, object_pk in targets:
+        pks_by_ctype.setdefault(_pk(content_type), set()).add(smart_text(object_pk))
+    q = None
+    for ctype_id, object_pks in pks_by_ctype.items():
+        ctype_q = Q(content_type=ctype_id, object_pk__in=object_pks)
+        q = ctype_q if q is None else q | ctype_q
+    return q
+
+
+def _keys_q(keys, fields=('content_type', 'site', 'user')):
+    """
+    Build a filter matching ``(content_type_id, object_pk, site_id)`` or
+    ``(content_type_id, object_pk, site_id, user_id)`` keys, with one ``IN``
+    clause per content type, site and user. ``fields`` names the key items
+    other than the object pk. Returns None for no keys.
+    """
+    groups = {}
+    for key in keys:
+        groups.setdefault((key[0],) + tuple(key[2:]), set()).add(key[1])
+    q = None
+    for group, object_pks in groups.items():
+        lookup = dict(zip(fields, group))
+        group_q = Q(object_pk__in=object_pks, **lookup)
+        q = group_q if q is None else q | group_q
+    return q
+
+
+LIKE = 'like'
+UNLIKE = 'unlike'
+
+LIKE_KEY_FIELDS = ('content_type_id', 'object_pk', 'site_id', 'user_id')
+
+TRENDING_WINDOWS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+
+
+def hour_bucket(when):
+    """
+    Truncate a datetime to the hourly bucket of ``LikeBucket``.
+    """
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def _add_delta(deltas, key, delta):
+    deltas[key] = deltas.get(key, 0) + delta
+
+
+# A like or unlike of an object by a user, see ``LikeManager.bulk_apply``
+LikeOperation = namedtuple('LikeOperation', 'action content_type_id object_pk site_id user_id submit_date')
+LikeOperation.__new__.__defaults__ = (None,)
+
+
+# Keyset pagination cursors, the ``submit_date`` (UTC) and ``id`` of the
+# last like of a page
+CURSOR_DATE_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def make_cursor(like):
+    """
+    Return the cursor of the likes following ``like`` in the newest first
+    order of ``LikeManager.page``.
+    """
+    submit_date = like.submit_date
+    if timezone.is_aware(submit_date):
+        submit_date = timezone.make_naive(submit_date, timezone.utc)
+    return '%s-%d' % (submit_date.strftime(CURSOR_DATE_FORMAT), like.pk)
+
+
+def parse_cursor(cursor):
+    """
+    Return the ``(submit_date, id)`` of a cursor, raising ValueError for
+    malformed cursors.
+    """
+    date, pk = smart_text(cursor).split('-', 1)
+    submit_date = datetime.strptime(date, CURSOR_DATE_FORMAT)
+    if settings.USE_TZ:
+        submit_date = timezone.make_aware(submit_date, timezone.utc)
+    return submit_date, int(pk)
+
+
+class LikePage(list):
+    """
+    A page of likes, ``next_cursor`` is None on the last page.
+    """
+    next_cursor = None
+
+
+def like_row_fields():
+    """
+    Return the columns read into a ``LikeRow``, with the username field of
+    the user model.
+    """
+    return ('pk', 'user', 'user__%s' % get_user_model().USERNAME_FIELD, 'submit_date')
+
+
+@python_2_unicode_compatible
+class LikeRow(namedtuple('LikeRow', 'pk user_id username submit_date')):
+    """
+    A like read as a plain row of its user and date, for lists that do not
+    need like instances.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.username or "N/A"
+
+
+def write_behind_enabled():
+    """
+    Whether like and unlike clicks are queued as ``PendingLike`` rows and
+    applied later by the ``likes_flush`` command.
+    """
+    return getattr(settings, 'LIKE_WRITE_BEHIND', False)
+
+
+def object_targets(objects):
+    """
+    Map every object to its ``(content_type_id, object_pk)`` key.
+    """
+    return dict((obj, (ContentType.objects.get_for_model(obj).pk, smart_text(obj.pk)))
+                for obj in objects)
+
+
+class LikeManager(models.Manager):
+    """
+    Queries over the likes of users.
+    """
+
+    def like(self, user, content_type, object_pk, site):
+        """
+        Like an object, at most once per user. The like is inserted right away
+        and the unique index rejects a concurrent duplicate, in which case the
+        existing like is returned. Returns a ``(like, created)`` tuple.
+        """
+        lookup = dict(content_type_id=_pk(content_type),
+                      object_pk=smart_text(object_pk),
+                      site_id=_pk(site),
+                      user_id=_pk(user),
+        )
+        with atomic(using=self.db):
+            try:
+                like = self.model(**lookup)
+                like.sends_like_added = True
+                with atomic(using=self.db):
+                    like.save(force_insert=True, using=self.db)
+                created = True
+            except IntegrityError:
+                like = self.get(**lookup)
+                created = False
+            if created:
+                self._record_changes(added=[(self._like_key(like), like.submit_date)])
+        if created:
+            background.send(signals.like_added, using=self.db, sender=self.model, submit_date=like.submit_date,
+                            **lookup)
+        return like, created
+
+    def unlike(self, user, content_type, object_pk, site):
+        """
+        Remove the like of a user with a single DELETE. Returns whether a like
+        was removed.
+
+        On PostgreSQL the DELETE also returns the submit date of the like for
+        the ``like_removed`` signal, other databases send None.
+        """
+        lookup = dict(content_type_id=_pk(content_type),
+                      object_pk=smart_text(object_pk),
+                      site_id=_pk(site),
+                      user_id=_pk(user),
+        )
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        columns = [opts.get_field(name).column for name in ('content_type', 'object_pk', 'site', 'user')]
+        sql = 'DELETE FROM %s WHERE %s' % (
+            qn(opts.db_table),
+            ' AND '.join('%s = %%s' % qn(column) for column in columns),
+        )
+        returning = connection.vendor == 'postgresql'
+        if returning:
+            sql += ' RETURNING %s' % qn(opts.get_field('submit_date').column)
+        with atomic(using=self.db):
+            cursor = connection.cursor()
+            cursor.execute(sql, [lookup['content_type_id'], lookup['object_pk'],
+                                 lookup['site_id'], lookup['user_id']])
+            removed = cursor.rowcount > 0
+            submit_date = cursor.fetchone()[0] if returning and removed else None
+            if removed:
+                self._record_changes(removed=[tuple(lookup[field] for field in LIKE_KEY_FIELDS)])
+        if removed:
+            background.send(signals.like_removed, using=self.db, sender=self.model, submit_date=submit_date, **lookup)
+        return removed
+
+    def bulk_apply(self, operations, send_signals=True):
+        """
+        Apply many ``LikeOperation`` in order within one transaction: one
+        query reads the current state, new likes are inserted with one
+        ``bulk_create`` and removed likes deleted with one batched delete.
+        Returns whether each operation changed anything.
+
+        Counters and buckets are always maintained; ``send_signals=False``
+        skips the ``like_added``/``like_removed`` signals, for imports.
+
+        Keep batches within the ``IN`` list limit of the database (999
+        variables on SQLite).
+        """
+        operations = [op._replace(object_pk=smart_text(op.object_pk)) for op in operations]
+        with atomic(using=self.db):
+            existing = self._get_likes(set(self._like_key(op) for op in operations))
+            liked = dict((key, True) for key in existing)
+            submit_dates = {}
+            results = []
+            for op in operations:
+                key = self._like_key(op)
+                wanted = op.action == LIKE
+                results.append(liked.get(key, False) != wanted)
+                if wanted and not liked.get(key, False):
+                    submit_dates[key] = op.submit_date or timezone.now()
+                liked[key] = wanted
+
+            added = self._bulk_insert(dict((key, submit_dates[key]) for key, value in liked.items()
+                                           if value and key not in existing))
+            removed = [key for key, value in liked.items() if not value and key in existing]
+            if removed:
+                self.filter(pk__in=[existing[key][0] for key in removed]).delete()
+
+            self._record_changes(added=[(key, submit_dates[key]) for key in added], removed=removed)
+
+        if not send_signals:
+            return results
+        for key in added:
+            background.send(signals.like_added, using=self.db, sender=self.model, submit_date=submit_dates[key],
+                            **dict(zip(LIKE_KEY_FIELDS, key)))
+        for key in removed:
+            background.send(signals.like_removed, using=self.db, sender=self.model, submit_date=existing[key][1],
+                            **dict(zip(LIKE_KEY_FIELDS, key)))
+        return results
+
+    def _record_changes(self, added=(), removed=()):
+        """
+        Move the counters and hourly buckets of the objects for likes added,
+        given as ``(key, submit_date)`` pairs, and for removed like keys.
+        Called within the transaction of the write.
+
+        Removed likes are taken off the current bucket, so buckets hold the
+        net like activity of each hour.
+        """
+        from like_system.models import LikeBucket, LikeCounter
+
+        now = timezone.now()
+        counter_deltas = {}
+        bucket_deltas = {}
+        for key, submit_date in added:
+            _add_delta(counter_deltas, key[:3], 1)
+            _add_delta(bucket_deltas, key[:3] + (hour_bucket(submit_date or now),), 1)
+        for key in removed:
+            _add_delta(counter_deltas, key[:3], -1)
+            _add_delta(bucket_deltas, key[:3] + (hour_bucket(now),), -1)
+        LikeCounter.objects.apply_deltas(counter_deltas)
+        LikeBucket.objects.apply_deltas(bucket_deltas)
+
+    @staticmethod
+    def _like_key(op):
+        return (op.content_type_id, op.object_pk, op.site_id, op.user_id)
+
+    def _get_likes(self, keys):
+        """
+        Return ``{key: (like_pk, submit_date)}`` for the given like keys that
+        exist.
+        """
+        q = _keys_q(keys)
+        if q is None:
+            return {}
+        rows = self.filter(q).values_list('pk', 'submit_date', 'content_type', 'object_pk', 'site', 'user')
+        return dict((tuple(row[2:]), row[:2]) for row in rows)
+
+    def _bulk_insert(self, submit_dates):
+        """
+        Insert likes from a ``{key: submit_date}`` dict with one
+        ``bulk_create``, falling back to one insert per like when a
+        concurrent request created some of them. Returns the inserted keys,
+        whose caches are patched by the caller.
+        """
+        if not submit_dates:
+            return []
+        now = timezone.now()
+        likes = [self.model(submit_date=submit_date or now, **dict(zip(LIKE_KEY_FIELDS, key)))
+                 for key, submit_date in submit_dates.items()]
+        try:
+            with atomic(using=self.db):
+                self.bulk_create(likes)
+            return list(submit_dates)
+        except IntegrityError:
+            pass
+
+        inserted = []
+        for like in likes:
+            like.sends_like_added = True
+            try:
+                with atomic(using=self.db):
+                    like.save(force_insert=True)
+                inserted.append(self._like_key(like))
+            except IntegrityError:
+                pass
+        return inserted
+
+    def for_object(self, content_type, object_pk, site):
+        return self.filter(content_type=_pk(content_type), object_pk=smart_text(object_pk), site=_pk(site))
+
+    def list_for_object(self, content_type, object_pk, site, rows=False):
+        """
+        Return the likes of an object, newest first, with their users joined,
+        or as ``LikeRow`` tuples with ``rows=True``.
+        """
+        return self._load_list(self.for_object(content_type, object_pk, site).order_by('-submit_date', '-pk'), rows)
+
+    def _load_list(self, qs, rows):
+        if rows:
+            return [LikeRow(*row) for row in qs.values_list(*like_row_fields())]
+        return list(qs.select_related('user'))
+
+    def page(self, content_type, object_pk, site, limit, after=None, rows=False):
+        """
+        Return up to ``limit`` likes of an object, newest first, starting
+        after the cursor ``after``. Pages are read by keyset on the
+        (content_type, object_pk, site, submit_date, id) index, so deep pages
+        cost as much as the first one. Raises ValueError for a bad cursor.
+        """
+        qs = self.for_object(content_type, object_pk, site).order_by('-submit_date', '-pk')
+        if after:
+            submit_date, pk = parse_cursor(after)
+            qs = qs.filter(Q(submit_date__lt=submit_date) | Q(submit_date=submit_date, pk__lt=pk))
+        likes = self._load_list(qs[:limit + 1], rows)
+        page = LikePage(likes[:limit])
+        if len(likes) > limit:
+            page.next_cursor = make_cursor(page[-1])
+        return page
+
+    def iter_likes(self, content_type, object_pk, site, chunk_size=1000, rows=False):
+        """
+        Iterate over all the likes of an object, newest first, one page of
+        ``chunk_size`` likes at a time. Memory use does not grow with the
+        number of likes, unlike ``QuerySet.iterator()`` whose database
+        drivers fetch the whole result.
+        """
+        cursor = None
+        while True:
+            page = self.page(content_type, object_pk, site, chunk_size, after=cursor, rows=rows)
+            for like in page:
+                yield like
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+    def liked_keys(self, user, targets, site):
+        """
+        Return the set of ``(content_type_id, object_pk)`` keys among
+        ``targets`` liked by ``user``, with a single query, or none at all
+        when the liked index of the user is cached (see
+        ``like_system.liked_index``). The Bloom filter of the user, when
+        enabled, rules out objects before querying (see ``like_system.bloom``).
+        """
+        from like_system import bloom, liked_index
+        from like_system.models import PendingLike
+
+        targets = list(targets)
+        liked = set()
+        remaining = targets
+        if liked_index.is_enabled():
+            liked, remaining = liked_index.lookup(user, targets, site)
+        if remaining and bloom.is_enabled():
+            remaining = bloom.might_contain(user, remaining, site)
+        q = _targets_q(remaining)
+        if q is not None:
+            liked.update(self.filter(q, user=_pk(user), site=_pk(site)).values_list('content_type', 'object_pk'))
+        if write_behind_enabled():
+            # users see their own queued likes and unlikes right away
+            for key, action in PendingLike.objects.pending_actions(user, targets, site).items():
+                if action == LIKE:
+                    liked.add(key)
+                else:
+                    liked.discard(key)
+        return liked
+
+
+class PendingLikeManager(models.Manager):
+    """
+    The write-behind queue of likes and unlikes, see ``write_behind_enabled``.
+
+    Operations are only appended, the operations of a user on an object are
+    coalesced when flushed. Flushing a batch twice is harmless as liking and
+    unliking are idempotent.
+    """
+
+    def enqueue(self, action, user, content_type, object_pk, site):
+        return self.create(action=action,
+                           content_type_id=_pk(content_type),
+                           object_pk=smart_text(object_pk),
+                           site_id=_pk(site),
+                           user_id=_pk(user),
+        )
+
+    def pending_actions(self, user, targets, site):
+        """
+        Return ``{(content_type_id, object_pk): action}`` of the latest queued
+        operation of ``user`` on each of the ``targets``.
+        """
+        q = _targets_q(targets)
+        if q is None:
+            return {}
+        rows = self.filter(q, user=_pk(user), site=_pk(site)).order_by('pk') \
+            .values_list('content_type', 'object_pk', 'action')
+        return dict(((ctype_id, object_pk), action) for ctype_id, object_pk, action in rows)
+
+    def flush(self, batch_size=500):
+        """
+        Apply the queued operations in batches of ``batch_size`` with
+        ``Like.objects.bulk_apply``. Returns the number of operations applied.
+        """
+        from like_system.models import Like
+
+        flushed = 0
+        while True:
+            with atomic(using=self.db):
+                rows = list(self.order_by('pk').values_list(
+                    'pk', 'action', 'content_type', 'object_pk', 'site', 'user', 'submit_date')[:batch_size])
+                if not rows:
+                    return flushed
+                Like.objects.bulk_apply([LikeOperation(*row[1:]) for row in rows])
+                self.filter(pk__in=[row[0] for row in rows]).delete()
+            flushed += len(rows)
+
+
+class LikeCounterManager(models.Manager):
+    """
+    Reads and writes the denormalized per-object like counters.
+
+    The count of an object may be spread over several shard rows so that
+    concurrent likes of a hot object do not all wait on the same row lock,
+    reads sum the shards. See ``like_system.cache.get_counter_shards``.
+    """
+
+    def get_count(self, content_type, object_pk, site):
+        """
+        Return the number of likes for an object, summing its counter shards.
+        """
+        return self.filter(content_type=_pk(content_type),
+                           object_pk=smart_text(object_pk),
+                           site=_pk(site),
+        ).aggregate(total=Sum('count'))['total'] or 0
+
+    def get_counts(self, targets, site):
+        """
+        Return a ``{(content_type_id, object_pk): count}`` dict for many
+        ``(content_type, object_pk)`` pairs with a single GROUP BY query.
+        """
+        targets = [(_pk(ctype), smart_text(object_pk)) for ctype, object_pk in targets]
+        counts = dict.fromkeys(targets, 0)
+        q = _targets_q(targets)
+        if q is None:
+            return counts
+        rows = self.filter(q, site=_pk(site)).values('content_type', 'object_pk').annotate(total=Sum('count'))
+        for row in rows:
+            counts[(row['content_type'], row['object_pk'])] = row['total']
+        return counts
+
+    def get_counts_for_objects(self, objects, site):
+        """
+        Return a ``{object: count}`` dict for a list of model instances with
+        a single query.
+        """
+        targets = object_targets(objects)
+        counts = self.get_counts(targets.values(), site)
+        return dict((obj, counts[key]) for obj, key in targets.items())
+
+    def choose_shard(self, content_type_id, object_pk, site_id):
+        """
+        Pick the counter shard a write goes to, at random among the shards of
+        the object, and note the write to detect hot objects.
+        """
+        like_cache.record_counter_write(content_type_id, object_pk, site_id)
+        return random.randrange(like_cache.get_counter_shards(content_type_id, object_pk, site_id))
+
+    def incr(self, content_type, object_pk, site, delta=1):
+        """
+        Atomically move the counter of an object by ``delta``, creating the
+        counter shard row the first time it is written.
+        """
+        lookup = dict(content_type_id=_pk(content_type),
+                      object_pk=smart_text(object_pk),
+                      site_id=_pk(site),
+        )
+        lookup['shard'] = self.choose_shard(lookup['content_type_id'], lookup['object_pk'], lookup['site_id'])
+        with atomic(using=self.db):
+            if self.filter(**lookup).update(count=F('count') + delta):
+                return
+            # no shard yet, a concurrent request may be creating it as well
+            try:
+                with atomic(using=self.db):
+                    self.create(count=delta, **lookup)
+            except IntegrityError:
+                self.filter(**lookup).update(count=F('count') + delta)
+
+    def decr(self, content_type, object_pk, site, delta=1):
+        return self.incr(content_type, object_pk, site, -delta)
+
+    def apply_deltas(self, deltas):
+        """
+        Move many counters from a ``{(content_type_id, object_pk, site_id):
+        delta}`` dict, with one UPDATE per content type, site, shard and delta
+        and a single ``bulk_create`` for the missing shards.
+        """
+        deltas = dict((key, delta) for key, delta in deltas.items() if delta)
+        if not deltas:
+            return
+        if len(deltas) == 1:
+            # a single UPDATE for the usual one-like write
+            key, delta = deltas.popitem()
+            return self.incr(key[0], key[1], key[2], delta)
+        with atomic(using=self.db):
+            existing = set(self.filter(_keys_q(deltas)).values_list('content_type', 'object_pk', 'site', 'shard'))
+            shards = dict((key, self.choose_shard(*key)) for key in deltas)
+            missing = [key for key in deltas if key + (shards[key],) not in existing]
+            if missing:
+                try:
+                    with atomic(using=self.db):
+                        self.bulk_create([self.model(content_type_id=key[0], object_pk=key[1], site_id=key[2],
+                                                     shard=shards[key], count=deltas[key])
+                                          for key in missing])
+                except IntegrityError:
+                    # created concurrently, move them one by one
+                    for key in missing:
+                        self.incr(key[0], key[1], key[2], deltas[key])
+
+            groups = {}
+            for key in deltas:
+                if key + (shards[key],) in existing:
+                    groups.setdefault((key[0], key[2], shards[key], deltas[key]), []).append(key[1])
+            for (ctype_id, site_id, shard, delta), object_pks in groups.items():
+                self.filter(content_type=ctype_id, site=site_id, shard=shard, object_pk__in=object_pks) \
+                    .update(count=F('count') + delta)
+
+    def recount(self, content_type, lower=None, upper=None, dry_run=False):
+        """
+        Recount the likes of the objects of a content type whose pk is within
+        ``[lower, upper)`` and correct the counters that drifted, returning
+        the ``{(content_type_id, object_pk, site_id): delta}`` corrections.
+
+        Safe to run on live traffic: corrections are applied as deltas, and
+        only after the drifted objects were counted again with their counter
+        rows locked, so likes written between the two queries of a count do
+        not look like drift.
+        """
+        from like_system.models import Like
+
+        ctype_id = _pk(content_type)
+        range_q = Q(content_type=ctype_id)
+        if lower is not None:
+            range_q &= Q(object_pk__gte=lower)
+        if upper is not None:
+            range_q &= Q(object_pk__lt=upper)
+        deltas = self._recount_deltas(ctype_id, Like.objects.filter(range_q), self.filter(range_q))
+        if not deltas or dry_run:
+            return deltas
+
+        with atomic(using=self.db):
+            keys_q = _keys_q(deltas, fields=('content_type', 'site'))
+            list(self.select_for_update().filter(keys_q).values_list('pk', flat=True))
+            confirmed = self._recount_deltas(ctype_id, Like.objects.filter(keys_q), self.filter(keys_q))
+            deltas = dict((key, delta) for key, delta in confirmed.items() if deltas.get(key) == delta)
+            self.apply_deltas(deltas)
+        for key in deltas:
+            like_cache.invalidate(*key)
+        return deltas
+
+    def _recount_deltas(self, ctype_id, likes, counters):
+        deltas = {}
+        for row in likes.order_by().values('object_pk', 'site').annotate(total=Count('pk')):
+            _add_delta(deltas, (ctype_id, row['object_pk'], row['site']), row['total'])
+        for row in counters.order_by().values('object_pk', 'site').annotate(total=Sum('count')):
+            _add_delta(deltas, (ctype_id, row['object_pk'], row['site']), -row['total'])
+        return dict((key, delta) for key, delta in deltas.items() if delta)
+
+
+class LikeBucketManager(models.Manager):
+    """
+    Reads and writes the hourly like aggregates behind the trending lists.
+    """
+
+    def incr(self, content_type, object_pk, site, bucket, delta=1):
+        """
+        Atomically move the hourly bucket of an object by ``delta``.
+        """
+        lookup = dict(content_type_id=_pk(content_type),
+                      object_pk=smart_text(object_pk),
+                      site_id=_pk(site),
+                      bucket=hour_bucket(bucket),
+        )
+        with atomic(using=self.db):
+            if self.filter(**lookup).update(count=F('count') + delta):
+                return
+            try:
+                with atomic(using=self.db):
+                    self.create(count=delta, **lookup)
+            except IntegrityError:
+                self.filter(**lookup).update(count=F('count') + delta)
+
+    def apply_deltas(self, deltas):
+        """
+        Move many buckets from a ``{(content_type_id, object_pk, site_id,
+        bucket): delta}`` dict, with one UPDATE per content type, site, bucket
+        and delta and a single ``bulk_create`` for the missing buckets.
+        """
+        deltas = dict((key, delta) for key, delta in deltas.items() if delta)
+        if not deltas:
+            return
+        if len(deltas) == 1:
+            key, delta = deltas.popitem()
+            return self.incr(key[0], key[1], key[2], key[3], delta)
+        fields = ('content_type', 'site', 'bucket')
+        with atomic(using=self.db):
+            existing = set(self.filter(_keys_q(deltas, fields)).values_list('content_type', 'object_pk', 'site', 'bucket'))
+            missing = [key for key in deltas if key not in existing]
+            if missing:
+                try:
+                    with atomic(using=self.db):
+                        self.bulk_create([self.model(content_type_id=key[0], object_pk=key[1], site_id=key[2],
+                                                     bucket=key[3], count=deltas[key])
+                                          for key in missing])
+                except IntegrityError:
+                    for key in missing:
+                        self.incr(key[0], key[1], key[2], key[3], deltas[key])
+
+            groups = {}
+            for key in existing:
+                groups.setdefault((key[0], key[2], key[3], deltas[key]), []).append(key[1])
+            for (ctype_id, site_id, bucket, delta), object_pks in groups.items():
+                self.filter(content_type=ctype_id, site=site_id, bucket=bucket, object_pk__in=object_pks) \
+                    .update(count=F('count') + delta)
+
+    def trending(self, content_type, window, n, site):
+        """
+        Return the ``n`` objects of a content type with the most net likes in
+        the last ``window`` ("hour", "day", "week" or a timedelta) as a list of
+        ``(object_pk, count)`` pairs, summing the buckets of the window.
+        """
+        if not isinstance(window, timedelta):
+            window = TRENDING_WINDOWS[window]
+        since = hour_bucket(timezone.now() - window + timedelta(hours=1))
+        rows = self.filter(content_type=_pk(content_type), site=_pk(site), bucket__gte=since) \
+            .values('object_pk').annotate(total=Sum('count')).filter(total__gt=0).order_by('-total')[:n]
+        return [(row['object_pk'], row['total']) for row in rows]
+
+    def trending_objects(self, content_type, window, n, site):
+        """
+        Like ``trending`` but returns ``(object, count)`` pairs, loading the
+        objects with one query and skipping deleted ones.
+        """
+        trending = self.trending(content_type, window, n, site)
+        objects = content_type.get_all_objects_for_this_type(pk__in=[object_pk for object_pk, count in trending])
+        objects = dict((smart_text(obj.pk), obj) for obj in objects)
+        return [(objects[object_pk], count) for object_pk, count in trending if object_pk in objects]
+
+
+# Relative differences of scores below this are rounding errors of log_add().
+LOG_EPSILON = 1e-9
+
+
+def log_add(a, b):
+    """
+    Return ``log(exp(a) + exp(b))`` without overflowing.
+    """
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def log_sub(a, b):
+    """
+    Return ``log(exp(a) - exp(b))``, or None when the difference is not
+    positive, rounding errors included.
+    """
+    if b >= a - LOG_EPSILON:
+        return None
+    return a + math.log1p(-math.exp(b - a))
+
+
+class LikeScoreManager(models.Manager):
+    """
+    Maintains the decayed popularity scores of the leaderboard, see
+    ``like_system.leaderboard``. Scores are stored as their logarithm.
+    """
+
+    def add_weight(self, content_type, object_pk, site, weight, sign=1, retries=5):
+        """
+        Add ``exp(weight)`` to the score of an object, or subtract it with
+        ``sign=-1``, using an optimistic compare-and-swap on the row version
+        so the update never waits on a lock held across queries. Returns the
+        new logarithmic score, or None when the object left the leaderboard
+        or the update kept conflicting.
+        """
+        lookup = dict(content_type_id=_pk(content_type),
+                      object_pk=smart_text(object_pk),
+                      site_id=_pk(site),
+        )
+        for attempt in range(retries):
+            rows = self.filter(**lookup).values_list('hot', 'version')[:1]
+            if not rows:
+                if sign < 0:
+                    return None
+                try:
+                    with atomic(using=self.db):
+                        self.create(hot=weight, **lookup)
+                    return weight
+                except IntegrityError:
+                    continue
+
+            hot, version = rows[0]
+            hot = log_add(hot, weight) if sign > 0 else log_sub(hot, weight)
+            current = self.filter(version=version, **lookup)
+            if hot is None:
+                # nothing left of the score, drop the object
+                current.delete()
+                if not self.filter(**lookup).exists():
+                    return None
+            elif current.update(hot=hot, version=F('version') + 1):
+                return hot
+        return None
+
+    def top(self, content_type, n, site):
+        """
+        Return the ``(hot, object_pk)`` pairs of the ``n`` best scored objects
+        of a content type, read from the (content_type, site, hot) index.
+        """
+        return list(self.filter(content_type=_pk(content_type), site=_pk(site))
+                    .order_by('-hot').values_list('hot', 'object_pk')[:n])
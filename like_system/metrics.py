@@ -0,0 +1,261 @@
+"""
+Counters and latency histograms of the like traffic, served in the
+Prometheus text format by the ``metrics`` view. Disabled unless::
+
+    LIKE_METRICS_ENABLED = True
+
+Every thread records into its own store, guarded by its own lock so the
+request path never waits on other threads; the view adds the stores up. With
+several worker processes (gunicorn, uwsgi), point ``LIKE_METRICS_DIR`` to a
+directory shared by the workers of a host: each process writes its totals
+there at most every ``LIKE_METRICS_FLUSH_INTERVAL`` seconds and the view adds
+up the files of all processes. The files of processes that exited are
+removed, which Prometheus sees as a counter reset.
+
+Metrics:
+
+* ``like_system_writes_total{action, result}``: like and unlike requests,
+  ``result`` being ``changed``, ``noop`` or ``queued`` (write-behind)
+* ``like_system_cache_requests_total{kind, result}``: cache ``hit``/``miss``
+* ``like_system_operation_seconds{operation}``: latency histogram of the
+  like tags and views, see ``like_system.instrumentation``
+"""
+import errno
+import json
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_FLUSH_INTERVAL = 5
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+_local = threading.local()
+_stores = []
+_stores_lock = threading.Lock()
+_last_flush = [0.0]
+_spool_name = [None, None]
+
+SPOOL_FILE_RE = re.compile(r'^likes-(\d+)-(\d+)\.json$')
+
+
+def is_enabled():
+    return getattr(settings, 'LIKE_METRICS_ENABLED', False)
+
+
+def _store():
+    """
+    Return the store of the current thread, ``{'lock': lock, 'counters':
+    {key: value}, 'histograms': {key: [bucket counts..., sum, count]}}``.
+    """
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {'lock': threading.Lock(), 'counters': {}, 'histograms': {}}
+        with _stores_lock:
+            _stores.append(store)
+    return store
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name, value=1, **labels):
+    """
+    Add ``value`` to a counter.
+    """
+    if not is_enabled():
+        return
+    store = _store()
+    key = _key(name, labels)
+    with store['lock']:
+        store['counters'][key] = store['counters'].get(key, 0) + value
+    _maybe_flush()
+
+
+def observe(name, value, **labels):
+    """
+    Record ``value`` (seconds) in a histogram.
+    """
+    if not is_enabled():
+        return
+    store = _store()
+    key = _key(name, labels)
+    with store['lock']:
+        histogram = store['histograms'].get(key)
+        if histogram is None:
+            histogram = store['histograms'][key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+                break
+        histogram[-2] += value
+        histogram[-1] += 1
+    _maybe_flush()
+
+
+def collect():
+    """
+    Return the ``(counters, histograms)`` totals of this process.
+    """
+    counters = {}
+    histograms = {}
+    with _stores_lock:
+        stores = list(_stores)
+    for store in stores:
+        with store['lock']:
+            store_counters = list(store['counters'].items())
+            store_histograms = [(key, list(values)) for key, values in store['histograms'].items()]
+        for key, value in store_counters:
+            counters[key] = counters.get(key, 0) + value
+        for key, values in store_histograms:
+            _add_histogram(histograms, key, values)
+    return counters, histograms
+
+
+def _add_histogram(histograms, key, values):
+    total = histograms.get(key)
+    if total is None:
+        histograms[key] = list(values)
+    else:
+        for i, value in enumerate(values):
+            total[i] += value
+
+
+def get_spool_dir():
+    return getattr(settings, 'LIKE_METRICS_DIR', None)
+
+
+def _spool_filename():
+    """
+    Return the spool file name of this process, unique to the process even
+    when its pid is reused later.
+    """
+    pid = os.getpid()
+    if _spool_name[0] != pid:
+        _spool_name[:] = [pid, 'likes-%d-%d.json' % (pid, time.time() * 1000)]
+    return _spool_name[1]
+
+
+def _is_running(pid):
+    if pid == os.getpid() or os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _remove_stale_files(spool_dir):
+    """
+    Remove the spool files of processes that exited, and older files of
+    reused pids. Returns the names of the remaining files.
+    """
+    latest = {}
+    stale = []
+    for filename in os.listdir(spool_dir):
+        match = SPOOL_FILE_RE.match(filename)
+        if match is None:
+            continue
+        pid, started = int(match.group(1)), int(match.group(2))
+        if not _is_running(pid) or latest.get(pid, (started, filename)) > (started, filename):
+            stale.append(filename)
+            continue
+        if pid in latest:
+            stale.append(latest[pid][1])
+        latest[pid] = (started, filename)
+    for filename in stale:
+        try:
+            os.remove(os.path.join(spool_dir, filename))
+        except OSError:
+            pass
+    return [filename for started, filename in latest.values()]
+
+
+def _maybe_flush():
+    interval = getattr(settings, 'LIKE_METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    if get_spool_dir() and time.time() - _last_flush[0] >= interval:
+        _last_flush[0] = time.time()
+        flush()
+
+
+def flush():
+    """
+    Write the totals of this process to its file of the spool directory,
+    replacing it atomically.
+    """
+    spool_dir = get_spool_dir()
+    counters, histograms = collect()
+    data = {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+    }
+    path = os.path.join(spool_dir, _spool_filename())
+    tmp_path = '%s.%d.tmp' % (path, threading.current_thread().ident or 0)
+    with open(tmp_path, 'w') as spool_file:
+        json.dump(data, spool_file)
+    os.rename(tmp_path, path)
+
+
+def collect_all():
+    """
+    Return the ``(counters, histograms)`` totals of all processes, reading
+    the spool directory when there is one.
+    """
+    spool_dir = get_spool_dir()
+    if not spool_dir:
+        return collect()
+    flush()
+    counters = {}
+    histograms = {}
+    for filename in _remove_stale_files(spool_dir):
+        try:
+            with open(os.path.join(spool_dir, filename)) as spool_file:
+                data = json.load(spool_file)
+        except (IOError, OSError, ValueError):
+            continue
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in data['histograms']:
+            _add_histogram(histograms, (name, tuple(tuple(label) for label in labels)), values)
+    return counters, histograms
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in labels)
+
+
+def _format_value(value):
+    return 'Inf' if value == float('inf') else repr(float(value))
+
+
+def render_text(counters, histograms):
+    """
+    Return the metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for name in sorted(set(name for name, labels in counters)):
+        lines.append('# TYPE %s counter' % name)
+        for (key_name, labels), value in sorted(counters.items()):
+            if key_name == name:
+                lines.append('%s%s %s' % (name, _format_labels(labels), _format_value(value)))
+    for name in sorted(set(name for name, labels in histograms)):
+        lines.append('# TYPE %s histogram' % name)
+        for (key_name, labels), values in sorted(histograms.items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                bucket_labels = labels + (('le', '+Inf' if bound == float('inf') else repr(bound)),)
+                lines.append('%s_bucket%s %d' % (name, _format_labels(bucket_labels), cumulative))
+            lines.append('%s_sum%s %s' % (name, _format_labels(labels), _format_value(values[-2])))
+            lines.append('%s_count%s %d' % (name, _format_labels(labels), values[-1]))
+    return '\n'.join(lines) + '\n'
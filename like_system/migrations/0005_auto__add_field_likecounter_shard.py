@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Removing unique constraint on 'LikeCounter', fields ['content_type', 'object_pk', 'site']
+        if db.backend_name == 'mysql':
+            db.execute('DROP INDEX django_like_system_counter_uniq ON django_like_system_counter')
+        else:
+            db.delete_unique('django_like_system_counter', ['content_type_id', 'object_pk', 'site_id'])
+
+        # Adding field 'LikeCounter.shard'
+        db.add_column('django_like_system_counter', 'shard',
+                      self.gf('django.db.models.fields.PositiveSmallIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding unique constraint on 'LikeCounter', fields ['content_type', 'object_pk', 'site', 'shard']
+        if db.backend_name == 'mysql':
+            # MySQL cannot index a TEXT column without a prefix length
+            db.execute('CREATE UNIQUE INDEX django_like_system_counter_uniq '
+                       'ON django_like_system_counter (content_type_id, object_pk(255), site_id, shard)')
+        else:
+            db.create_unique('django_like_system_counter', ['content_type_id', 'object_pk', 'site_id', 'shard'])
+
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'LikeCounter', fields ['content_type', 'object_pk', 'site', 'shard']
+        if db.backend_name == 'mysql':
+            db.execute('DROP INDEX django_like_system_counter_uniq ON django_like_system_counter')
+        else:
+            db.delete_unique('django_like_system_counter', ['content_type_id', 'object_pk', 'site_id', 'shard'])
+
+        if not db.dry_run:
+            # Dropping the shards, the counters are rebuilt from the likes below
+            db.execute('DELETE FROM django_like_system_counter')
+
+        # Deleting field 'LikeCounter.shard'
+        db.delete_column('django_like_system_counter', 'shard')
+
+        # Adding unique constraint on 'LikeCounter', fields ['content_type', 'object_pk', 'site']
+        if db.backend_name == 'mysql':
+            db.execute('CREATE UNIQUE INDEX django_like_system_counter_uniq '
+                       'ON django_like_system_counter (content_type_id, object_pk(255), site_id)')
+        else:
+            db.create_unique('django_like_system_counter', ['content_type_id', 'object_pk', 'site_id'])
+
+        if not db.dry_run:
+            db.execute('INSERT INTO django_like_system_counter (content_type_id, object_pk, site_id, count) '
+                       'SELECT content_type_id, object_pk, site_id, COUNT(*) FROM django_like_system '
+                       'GROUP BY content_type_id, object_pk, site_id')
+
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Group']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Permission']"}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'like_system.like': {
+            'Meta': {'ordering': "('-submit_date',)", 'unique_together': "(('content_type', 'object_pk', 'site', 'user'),)", 'object_name': 'Like', 'db_table': "'django_like_system'"},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'content_type_set_for_like'", 'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_pk': ('django.db.models.fields.TextField', [], {}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'submit_date': ('django.db.models.fields.DateTimeField', [], {'default': 'None'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'like_comments'", 'null': 'True', 'to': u"orm['auth.User']"}),
+            'user_url': ('django.db.models.fields.URLField', [], {'max_length': '200', 'blank': 'True'})
+        },
+        u'like_system.likecounter': {
+            'Meta': {'unique_together': "(('content_type', 'object_pk', 'site', 'shard'),)", 'object_name': 'LikeCounter', 'db_table': "'django_like_system_counter'"},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'content_type_set_for_likecounter'", 'to': u"orm['contenttypes.ContentType']"}),
+            'count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_pk': ('django.db.models.fields.TextField', [], {}),
+            'shard': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"})
+        },
+        u'like_system.pendinglike': {
+            'Meta': {'ordering': "('pk',)", 'object_name': 'PendingLike', 'db_table': "'django_like_system_pending'"},
+            'action': ('django.db.models.fields.CharField', [], {'max_length': '6'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'content_type_set_for_pendinglike'", 'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_pk': ('django.db.models.fields.TextField', [], {}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'submit_date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']"})
+        },
+        u'sites.site': {
+            'Meta': {'ordering': "(u'domain',)", 'object_name': 'Site', 'db_table': "u'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        }
+    }
+
+    complete_apps = ['like_system']
\ No newline at end of file
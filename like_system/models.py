@@ -2,12 +2,17 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from like_system import bloom, cache, leaderboard, liked_index, resolvers, signals
+from like_system.managers import (LIKE, UNLIKE, LikeBucketManager, LikeCounterManager, LikeManager,
+                                  LikeScoreManager, PendingLikeManager)
+
 
 class BaseLikeAbstractModel(models.Model):
     """
@@ -42,6 +47,107 @@ class BaseLikeAbstractModel(models.Model):
 
 
 
+@python_2_unicode_compatible
+class LikeCounter(BaseLikeAbstractModel):
+    """
+    Denormalized number of likes of some object, kept in sync by the like and
+    unlike views so counting reads a few rows instead of a COUNT(*). The
+    count of a hot object is spread over several shards.
+    """
+
+    shard = models.PositiveSmallIntegerField(_('shard'), default=0)
+    count = models.IntegerField(_('count'), default=0)
+
+    # Manager
+    objects = LikeCounterManager()
+
+    class Meta:
+        db_table = "django_like_system_counter"
+        unique_together = (('content_type', 'object_pk', 'site', 'shard'),)
+        verbose_name = _('like counter')
+        verbose_name_plural = _('like counters')
+
+    def __str__(self):
+        return "%s" % self.count
+
+
+@python_2_unicode_compatible
+class LikeBucket(BaseLikeAbstractModel):
+    """
+    Net number of likes of some object within an hour, maintained by the
+    like and unlike write path and summed over a window for trending lists.
+    """
+
+    bucket = models.DateTimeField(_('hour'))
+    count = models.IntegerField(_('count'), default=0)
+
+    # Manager
+    objects = LikeBucketManager()
+
+    class Meta:
+        db_table = "django_like_system_bucket"
+        unique_together = (('content_type', 'object_pk', 'site', 'bucket'),)
+        index_together = (('content_type', 'site', 'bucket'),)
+        verbose_name = _('like bucket')
+        verbose_name_plural = _('like buckets')
+
+    def __str__(self):
+        return "%s: %s" % (self.bucket, self.count)
+
+
+@python_2_unicode_compatible
+class LikeScore(BaseLikeAbstractModel):
+    """
+    Time decayed popularity of some object, stored as a logarithm and read in
+    order for the leaderboard. See ``like_system.leaderboard``.
+    """
+
+    hot = models.FloatField(_('hot'))
+    version = models.PositiveIntegerField(_('version'), default=0)
+
+    # Manager
+    objects = LikeScoreManager()
+
+    class Meta:
+        db_table = "django_like_system_score"
+        unique_together = (('content_type', 'object_pk', 'site'),)
+        index_together = (('content_type', 'site', 'hot'),)
+        verbose_name = _('like score')
+        verbose_name_plural = _('like scores')
+
+    def __str__(self):
+        return "%s" % self.hot
+
+
+@python_2_unicode_compatible
+class PendingLike(BaseLikeAbstractModel):
+    """
+    A like or unlike queued by the write-behind mode (``LIKE_WRITE_BEHIND``)
+    until the ``likes_flush`` command applies it.
+    """
+
+    ACTION_CHOICES = (
+        (LIKE, _('like')),
+        (UNLIKE, _('unlike')),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('user'))
+    action = models.CharField(_('action'), max_length=6, choices=ACTION_CHOICES)
+    submit_date = models.DateTimeField(_('date/time submitted'), default=timezone.now)
+
+    # Manager
+    objects = PendingLikeManager()
+
+    class Meta:
+        db_table = "django_like_system_pending"
+        ordering = ('pk',)
+        verbose_name = _('pending like')
+        verbose_name_plural = _('pending likes')
+
+    def __str__(self):
+        return "%s %s" % (self.action, self.object_pk)
+
+
 @python_2_unicode_compatible
 class Like(BaseLikeAbstractModel):
     """
@@ -60,16 +166,22 @@ class Like(BaseLikeAbstractModel):
     submit_date = models.DateTimeField(_('date/time submitted'), default=None)
 
     # Manager
-    # objects = LikeManager()
+    objects = LikeManager()
 
     class Meta:
         db_table = "django_like_system"
         ordering = ('-submit_date',)
+        # a user likes an object once, this is also the lookup of the
+        # like/unlike views and the liked_this tag. Indexes over the TEXT
+        # object_pk need the South migrations on MySQL, see README.rst
+        unique_together = (('content_type', 'object_pk', 'site', 'user'),)
+        # keyset pagination of the likes of an object, see LikeManager.page
+        index_together = (('content_type', 'object_pk', 'site', 'submit_date', 'id'),)
         verbose_name = _('like')
         verbose_name_plural = _('likes')
 
     def __str__(self):
-        if self.user.username:
+        if self.user_id and self.user.username:
             return "%s" % (self.user.username)
         else:
             return "N/A"
@@ -151,3 +263,31 @@ class Like(BaseLikeAbstractModel):
     #         'url': self.get_absolute_url()
     #     }
     #     return _('Posted by %(user)s at %(date)s\n\n%(comment)s\n\nhttp://%(domain)s%(url)s') % d
+
+
+# keep cached counts and lists in sync with the likes
+post_save.connect(cache.like_saved, sender=Like, dispatch_uid='like_system.cache.like_saved')
+post_delete.connect(cache.like_deleted, sender=Like, dispatch_uid='like_system.cache.like_deleted')
+signals.like_added.connect(cache.like_changed, sender=Like, dispatch_uid='like_system.cache.like_added')
+signals.like_removed.connect(cache.like_changed, sender=Like, dispatch_uid='like_system.cache.like_removed')
+
+# patch the cached liked indexes of the users
+post_save.connect(liked_index.like_saved, sender=Like, dispatch_uid='like_system.liked_index.like_saved')
+post_delete.connect(liked_index.like_deleted, sender=Like, dispatch_uid='like_system.liked_index.like_deleted')
+signals.like_added.connect(liked_index.like_added, sender=Like, dispatch_uid='like_system.liked_index.like_added')
+signals.like_removed.connect(liked_index.like_removed, sender=Like,
+                             dispatch_uid='like_system.liked_index.like_removed')
+
+# add new likes to the Bloom filters of the users, post_save covering the likes
+# saved without the like_added signal
+post_save.connect(bloom.like_saved, sender=Like, dispatch_uid='like_system.bloom.like_saved')
+signals.like_added.connect(bloom.like_added, sender=Like, dispatch_uid='like_system.bloom.like_added')
+
+# maintain the decayed scores of the leaderboard
+signals.like_added.connect(leaderboard.like_added, sender=Like, dispatch_uid='like_system.leaderboard.like_added')
+signals.like_removed.connect(leaderboard.like_removed, sender=Like,
+                             dispatch_uid='like_system.leaderboard.like_removed')
+
+# rebuild the content type map of the like URLs when content types change
+post_save.connect(resolvers.clear_cache, sender=ContentType, dispatch_uid='like_system.resolvers.saved')
+post_delete.connect(resolvers.clear_cache, sender=ContentType, dispatch_uid='like_system.resolvers.deleted')
@@ -0,0 +1,62 @@
+"""
+Resolves the content type token of the like URLs without a query per click.
+
+Tokens are ``app_label.model`` (as produced by the link tags), bare model
+names are still accepted when a single app defines them.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import get_current_site
+
+_content_types_by_model = None
+
+
+def get_content_types_by_model():
+    """
+    Return the in-process ``{model: [content_type, ...]}`` map, built once
+    from a single query and dropped when content types change.
+    """
+    global _content_types_by_model
+    if _content_types_by_model is None:
+        by_model = {}
+        for ct in ContentType.objects.all():
+            by_model.setdefault(ct.model, []).append(ct)
+        _content_types_by_model = by_model
+    return _content_types_by_model
+
+
+def clear_cache(*args, **kwargs):
+    """
+    Drop the content type map, connected to the ContentType signals.
+    """
+    global _content_types_by_model
+    _content_types_by_model = None
+
+
+def get_content_type_token(content_type):
+    """
+    Return the ``app_label.model`` URL token of a content type.
+    """
+    return '%s.%s' % (content_type.app_label, content_type.model)
+
+
+def resolve_content_type(token):
+    """
+    Return the ContentType named by an URL token, raises
+    ``ContentType.DoesNotExist`` for unknown or ambiguous tokens.
+    """
+    if '.' in token:
+        app_label, model = token.split('.', 1)
+        # served from the ContentType manager cache after the first lookup
+        return ContentType.objects.get_by_natural_key(app_label, model)
+    content_types = get_content_types_by_model().get(token, [])
+    if len(content_types) != 1:
+        raise ContentType.DoesNotExist("No unique content type for %r" % token)
+    return content_types[0]
+
+
+def resolve_target(request, token):
+    """
+    Return the ``(content_type, site)`` of a like request. The site comes
+    from Django's SITE_CACHE after the first request.
+    """
+    return resolve_content_type(token), get_current_site(request)
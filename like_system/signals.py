@@ -0,0 +1,20 @@
+"""
+Signals sent by the like write path, only when a like was actually added or
+removed. They are sent after the write committed, or before when it runs in
+an open transaction on Django versions without commit hooks (see
+``like_system.background``), and provide the ids of the liked object and
+the submit date of the like::
+
+    content_type_id, object_pk, site_id, user_id, submit_date
+
+``submit_date`` is None for likes removed by ``Like.objects.unlike`` on
+databases other than PostgreSQL, whose single DELETE cannot return it.
+
+``operation_measured`` is sent with the ``Measurement`` of every instrumented
+tag or view call while it has receivers, see ``like_system.instrumentation``.
+"""
+from django.dispatch import Signal
+
+like_added = Signal(providing_args=['content_type_id', 'object_pk', 'site_id', 'user_id', 'submit_date'])
+like_removed = Signal(providing_args=['content_type_id', 'object_pk', 'site_id', 'user_id', 'submit_date'])
+operation_measured = Signal(providing_args=['measurement'])
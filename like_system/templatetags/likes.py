@@ -1,19 +1,44 @@
 from django import template
 from django.conf import settings
-from django.contrib.sites.models import get_current_site
 from django.core.urlresolvers import reverse
 from django.template.loader import render_to_string
 from django.utils.encoding import smart_text
 from django.contrib.contenttypes.models import ContentType
 
 import like_system
-from like_system.models import Like
+from like_system import cache as like_cache
+from like_system.backends import get_backend
+from like_system.instrumentation import instrument
+from like_system.leaderboard import top_liked
+from like_system.liked import get_liked_set
+from like_system.managers import TRENDING_WINDOWS, LikePage, object_targets
+from like_system.resolvers import get_content_type_token
+from like_system.models import LikeBucket
 
 register = template.Library()
 
+DEFAULT_TRENDING_WINDOW = 'day'
+DEFAULT_TRENDING_LIMIT = 10
+DEFAULT_TRENDING_TIMEOUT = 60
+DEFAULT_TOP_LIKED_LIMIT = 10
+
 
 # Base
-class BaseLikeNode(template.Node):
+class InstrumentedNode(template.Node):
+    """
+    A node whose renders are measured by ``like_system.instrumentation``,
+    subclasses implement ``render_tag``.
+    """
+    def render(self, context):
+        with instrument('tag:%s' % type(self).__name__):
+            return self.render_tag(context)
+
+    def render_tag(self, context):
+        """Subclasses should override this."""
+        raise NotImplementedError
+
+
+class BaseLikeNode(InstrumentedNode):
     """
     Base helper class (abstract) for handling the get_like_* template tags.
     """
@@ -21,7 +46,11 @@ class BaseLikeNode(template.Node):
     @classmethod
     def handle_token(cls, parser, token):
         """Class method to parse get_comment_list/count/form and return a Node."""
-        tokens = token.split_contents()
+        return cls.handle_tokens(parser, token.split_contents())
+
+    @classmethod
+    def handle_tokens(cls, parser, tokens, **kwargs):
+        """Build a Node from the split tag, passing ``kwargs`` to the Node."""
         if tokens[1] != 'for':
             raise template.TemplateSyntaxError("Second argument in %r tag must be 'for'" % tokens[0])
 
@@ -32,6 +61,7 @@ class BaseLikeNode(template.Node):
             return cls(
                 object_expr = parser.compile_filter(tokens[2]),
                 as_varname = tokens[4],
+                **kwargs
             )
 
         # {% get_whatever for app.model pk as varname %}
@@ -41,7 +71,8 @@ class BaseLikeNode(template.Node):
             return cls(
                 ctype = BaseLikeNode.lookup_content_type(tokens[2], tokens[0]),
                 object_pk_expr = parser.compile_filter(tokens[3]),
-                as_varname = tokens[5]
+                as_varname = tokens[5],
+                **kwargs
             )
 
         else:
@@ -80,6 +111,12 @@ class BaseLikeNode(template.Node):
         )
         return qs
 
+    def get_cached(self, kind, ctype, object_pk, loader):
+        """
+        Return the value of ``loader()`` through the like cache, when enabled.
+        """
+        return like_cache.get_or_load(kind, ctype, object_pk, settings.SITE_ID, loader)
+
     def get_target_ctype_pk(self, context):
         if self.object_expr:
             try:
@@ -90,7 +127,7 @@ class BaseLikeNode(template.Node):
         else:
             return self.ctype, self.object_pk_expr.resolve(context, ignore_failures=True)
 
-    def render(self, context):
+    def render_tag(self, context):
         qs = self.get_query_set(context)
         context[self.as_varname] = self.get_context_value_from_queryset(context, qs)
         return ''
@@ -108,7 +145,7 @@ class BaseLikeLinkNode(BaseLikeNode):
     def get_context_value_from_queryset(self, context, qs):
         pass
 
-    def render(self, context):
+    def render_tag(self, context):
         # qs = self.get_query_set(context)
         context[self.as_varname] = self.get_like_link_for_qt(context)
         return ''
@@ -126,7 +163,7 @@ class BaseLikedLinkNode(BaseLikeNode):
     def get_context_value_from_queryset(self, context, qs):
         pass
 
-    def render(self, context):
+    def render_tag(self, context):
         # qs = self.get_query_set(context)
         context[self.as_varname] = self.get_liked_this(context)
         return ''
@@ -142,13 +179,84 @@ class BaseLikedLinkNode(BaseLikeNode):
 # List Nodes
 class LikeListNode(BaseLikeNode):
     """Insert a list of comments into the context."""
-    def get_context_value_from_queryset(self, context, qs):
-        return list(qs)
+    def __init__(self, limit_expr=None, after_expr=None, rows=False, **kwargs):
+        super(LikeListNode, self).__init__(**kwargs)
+        self.limit_expr = limit_expr
+        self.after_expr = after_expr
+        self.rows = rows
+
+    def render_tag(self, context):
+        ctype, object_pk = self.get_target_ctype_pk(context)
+        if not object_pk:
+            context[self.as_varname] = []
+        elif self.limit_expr is not None:
+            context[self.as_varname] = self.get_page(context, ctype, object_pk)
+        else:
+            context[self.as_varname] = self.get_cached('rows' if self.rows else 'list', ctype, object_pk,
+                lambda: get_backend().list(ctype, object_pk, settings.SITE_ID, rows=self.rows))
+        return ''
+
+    def get_page(self, context, ctype, object_pk):
+        after = self.after_expr.resolve(context, ignore_failures=True) if self.after_expr else None
+        try:
+            limit = int(self.limit_expr.resolve(context, ignore_failures=True))
+            return get_backend().list(ctype, object_pk, settings.SITE_ID, limit, after, self.rows)
+        except (TypeError, ValueError):
+            return LikePage()
 
 class LikeCountNode(BaseLikeNode):
     """Insert a count of likes into the context."""
-    def get_context_value_from_queryset(self, context, qs):
-        return qs.count()
+    def render_tag(self, context):
+        # read the denormalized counter instead of counting the likes
+        ctype, object_pk = self.get_target_ctype_pk(context)
+        if not object_pk:
+            context[self.as_varname] = 0
+        else:
+            context[self.as_varname] = self.get_cached('count', ctype, object_pk,
+                lambda: get_backend().count(ctype, object_pk, settings.SITE_ID))
+        return ''
+
+
+class LikeCountsNode(BaseLikeNode):
+    """Insert a dict of like counts keyed by object into the context."""
+    def render_tag(self, context):
+        try:
+            objects = self.object_expr.resolve(context)
+        except template.VariableDoesNotExist:
+            objects = None
+        targets = object_targets(objects or [])
+        counts = like_cache.get_many_or_load('count', targets.values(), settings.SITE_ID,
+            lambda missing: get_backend().bulk_count(missing, settings.SITE_ID))
+        context[self.as_varname] = dict((obj, counts[key]) for obj, key in targets.items())
+        return ''
+
+
+class TrendingNode(InstrumentedNode):
+    """Insert the most liked objects of a recent window into the context."""
+    def __init__(self, ctype, window, limit, as_varname):
+        self.ctype = ctype
+        self.window = window
+        self.limit = limit
+        self.as_varname = as_varname
+
+    def render_tag(self, context):
+        key = '%s:%s' % (self.window, self.limit)
+        context[self.as_varname] = like_cache.get_or_load('trending', self.ctype, key, settings.SITE_ID,
+            lambda: LikeBucket.objects.trending_objects(self.ctype, self.window, self.limit, settings.SITE_ID),
+            timeout=getattr(settings, 'LIKE_TRENDING_TIMEOUT', DEFAULT_TRENDING_TIMEOUT))
+        return ''
+
+
+class TopLikedNode(InstrumentedNode):
+    """Insert the objects with the best decayed like score into the context."""
+    def __init__(self, ctype, limit, as_varname):
+        self.ctype = ctype
+        self.limit = limit
+        self.as_varname = as_varname
+
+    def render_tag(self, context):
+        context[self.as_varname] = top_liked(self.ctype, self.limit, settings.SITE_ID)
+        return ''
 
 
 
@@ -157,13 +265,13 @@ class LikeLinkNode(BaseLikeLinkNode):
     """Insert a count of likes into the context."""
     def get_like_link_for_qt(self, context):
         obj, pk = self.get_target_ctype_pk(context)
-        return reverse('like_system-like', kwargs={'content_type':obj.model, 'object_pk':pk })
+        return reverse('like_system-like', kwargs={'content_type':get_content_type_token(obj), 'object_pk':pk })
 
 class UnlikeLinkNode(BaseLikeLinkNode):
     """Insert a count of likes into the context."""
     def get_like_link_for_qt(self, context):
         obj, pk = self.get_target_ctype_pk(context)
-        return reverse('like_system-unlike', kwargs={'content_type':obj.model, 'object_pk':pk })
+        return reverse('like_system-unlike', kwargs={'content_type':get_content_type_token(obj), 'object_pk':pk })
 
 
 
@@ -172,18 +280,24 @@ class LikedLinkNode(BaseLikedLinkNode):
     """Insert a count of likes into the context."""
     def get_liked_this(self, context):
         obj, pk = self.get_target_ctype_pk(context)
-        # get unique like
-        try:
-            like = Like.objects.get(site=get_current_site(context),
-                                   user=context['user'],
-                                   content_type=obj,
-                                   object_pk=pk
-            )
-            return True
-        except:
-            pass
+        if not pk:
+            return False
+        # answered from the likes preloaded for this request
+        return get_liked_set(context).liked(obj, pk)
 
-        return False
+
+class PreloadLikedNode(InstrumentedNode):
+    """Load the liked state of a list of objects for later liked_this tags."""
+    def __init__(self, object_list_expr):
+        self.object_list_expr = object_list_expr
+
+    def render_tag(self, context):
+        try:
+            objects = self.object_list_expr.resolve(context)
+        except template.VariableDoesNotExist:
+            objects = None
+        get_liked_set(context).preload_objects(objects or [])
+        return ''
 
 
 
@@ -206,6 +320,102 @@ def get_like_count(parser, token):
 
     return LikeCountNode.handle_token(parser, token)
 
+@register.tag
+def get_like_counts(parser, token):
+    """
+    Gets the like counts of a list of objects with a single query and
+    populates the template context with a dict keyed by object.
+
+    Syntax::
+
+        {% get_like_counts for [object_list] as [varname]  %}
+
+    Example usage::
+
+        {% get_like_counts for book_list as like_counts %}
+        {% for book in book_list %}
+            {{ like_counts|for_object:book }}
+        {% endfor %}
+    """
+    if len(token.split_contents()) != 5:
+        raise template.TemplateSyntaxError("%r tag requires 4 arguments" % token.split_contents()[0])
+    return LikeCountsNode.handle_token(parser, token)
+
+@register.tag
+def get_trending(parser, token):
+    """
+    Gets the objects of a model with the most likes in the last hour, day or
+    week as a list of ``(object, count)`` pairs, from the hourly buckets.
+
+    Syntax::
+
+        {% get_trending for [app].[model] [hour|day|week] [limit] as [varname] %}
+
+    Window and limit are optional and default to ``day`` and 10.
+
+    Example usage::
+
+        {% get_trending for example.book week 5 as trending %}
+        {% for book, like_count in trending %}
+            ...
+        {% endfor %}
+    """
+    tokens = token.split_contents()
+    if len(tokens) not in (5, 6, 7) or tokens[1] != 'for' or tokens[-2] != 'as':
+        raise template.TemplateSyntaxError("%r tag must be used as {%% %s for [app].[model] [window] [limit] as [varname] %%}" % (tokens[0], tokens[0]))
+    window = DEFAULT_TRENDING_WINDOW
+    limit = DEFAULT_TRENDING_LIMIT
+    for option in tokens[3:-2]:
+        if option in TRENDING_WINDOWS:
+            window = option
+        elif option.isdigit():
+            limit = int(option)
+        else:
+            raise template.TemplateSyntaxError("%r tag got an invalid window or limit: %r" % (tokens[0], option))
+    ctype = BaseLikeNode.lookup_content_type(tokens[2], tokens[0])
+    return TrendingNode(ctype, window, limit, tokens[-1])
+
+@register.tag
+def get_top_liked(parser, token):
+    """
+    Gets the most popular objects of a model, with older likes counting less
+    than recent ones, from the in-memory leaderboard.
+
+    Syntax::
+
+        {% get_top_liked for [app].[model] [limit] as [varname] %}
+
+    The limit is optional and defaults to 10.
+
+    Example usage::
+
+        {% get_top_liked for example.book 5 as popular_books %}
+        {% for book in popular_books %}
+            ...
+        {% endfor %}
+    """
+    tokens = token.split_contents()
+    if len(tokens) not in (5, 6) or tokens[1] != 'for' or tokens[-2] != 'as':
+        raise template.TemplateSyntaxError("%r tag must be used as {%% %s for [app].[model] [limit] as [varname] %%}" % (tokens[0], tokens[0]))
+    limit = DEFAULT_TOP_LIKED_LIMIT
+    if len(tokens) == 6:
+        if not tokens[3].isdigit():
+            raise template.TemplateSyntaxError("%r tag got an invalid limit: %r" % (tokens[0], tokens[3]))
+        limit = int(tokens[3])
+    ctype = BaseLikeNode.lookup_content_type(tokens[2], tokens[0])
+    return TopLikedNode(ctype, limit, tokens[-1])
+
+@register.filter
+def for_object(mapping, obj):
+    """
+    Look up ``obj`` in a dict keyed by object, such as the one populated by
+    ``get_like_counts``.
+    """
+    try:
+        return mapping[obj]
+    except (KeyError, TypeError):
+        return None
+
 @register.tag
 def get_like_list(parser, token):
     """
@@ -225,8 +435,37 @@ def get_like_list(parser, token):
             ...
         {% endfor %}
 
+    The likes of popular objects are better read one page at a time, newest
+    first, with the ``limit`` and ``after`` options. The cursor of the next
+    page is given by the ``next_cursor`` attribute of the list::
+
+        {% get_like_list for event limit 20 after request.GET.after as like_list %}
+        {% if like_list.next_cursor %}
+            <a href="?after={{ like_list.next_cursor }}">more</a>
+        {% endif %}
+
+    Templates showing only the usernames and dates of the likes can ask for
+    ``rows``, light ``(pk, user_id, username, submit_date)`` tuples read
+    without building like and user instances::
+
+        {% get_like_list for event rows limit 20 as like_list %}
+        {% for like in like_list %}{{ like.username }}{% endfor %}
+
     """
-    return LikeListNode.handle_token(parser, token)
+    tokens = token.split_contents()
+    options = {}
+    while len(tokens) > 5 and tokens[-2] == 'as':
+        if tokens[-3] == 'rows':
+            options['rows'] = True
+            del tokens[-3]
+        elif len(tokens) > 6 and tokens[-4] in ('limit', 'after'):
+            options['%s_expr' % tokens[-4]] = parser.compile_filter(tokens[-3])
+            del tokens[-4:-2]
+        else:
+            break
+    if 'after_expr' in options and 'limit_expr' not in options:
+        raise template.TemplateSyntaxError("%r tag requires a limit to page after a cursor" % tokens[0])
+    return LikeListNode.handle_tokens(parser, tokens, **options)
 
 @register.tag
 def get_like_link(parser, token):
@@ -268,4 +507,27 @@ def get_unlike_link(parser, token):
 @register.tag()
 def liked_this(parser, token):
 
-    return LikedLinkNode.handle_token(parser, token)
\ No newline at end of file
+    return LikedLinkNode.handle_token(parser, token)
+
+@register.tag
+def preload_liked(parser, token):
+    """
+    Load whether the current user liked each object of a list with a single
+    query, so the ``liked_this`` tags for these objects need no query.
+
+    Syntax::
+
+        {% preload_liked for [object_list] %}
+
+    Example usage::
+
+        {% preload_liked for book_list %}
+        {% for book in book_list %}
+            {% liked_this for book as liked %}
+            ...
+        {% endfor %}
+    """
+    tokens = token.split_contents()
+    if len(tokens) != 3 or tokens[1] != 'for':
+        raise template.TemplateSyntaxError("%r tag must be used as {%% %s for [object_list] %%}" % (tokens[0], tokens[0]))
+    return PreloadLikedNode(parser.compile_filter(tokens[2]))
\ No newline at end of file
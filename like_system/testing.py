@@ -0,0 +1,49 @@
+"""
+Test helpers keeping the like tags and views of a page within a query
+budget, so that N+1 regressions fail the build::
+
+    from like_system.testing import LikeQueryBudgetMixin
+
+    class BookListTests(LikeQueryBudgetMixin, TestCase):
+
+        def test_book_list(self):
+            with self.assertLikeQueries(2):
+                self.client.get('/books/')
+
+            # or for one kind of tag
+            with self.assertLikeQueries(1, name='tag:LikeCountsNode'):
+                self.client.get('/books/')
+"""
+from contextlib import contextmanager
+
+from like_system.instrumentation import capture
+
+
+@contextmanager
+def like_query_budget(max_queries, name=None):
+    """
+    Fail with an AssertionError when the like tags and views run within the
+    block issue more than ``max_queries`` queries, only counting the
+    operation ``name`` when given. Nested measurements are part of the
+    enclosing ones, so only the outermost are added up.
+    """
+    with capture() as measurements:
+        yield measurements
+    if name is None:
+        measured = [measurement for measurement in measurements if measurement.depth == 0]
+    else:
+        measured = [measurement for measurement in measurements if measurement.name == name]
+    queries = sum(measurement.queries for measurement in measured)
+    if queries > max_queries:
+        raise AssertionError("%d like queries executed, %d allowed:\n%s" % (
+            queries, max_queries,
+            '\n'.join('  %s: %d queries' % (measurement.name, measurement.queries) for measurement in measured)))
+
+
+class LikeQueryBudgetMixin(object):
+    """
+    Adds ``assertLikeQueries`` to a test case.
+    """
+
+    def assertLikeQueries(self, max_queries, name=None):
+        return like_query_budget(max_queries, name)
@@ -1,4 +1,35 @@
-from django.test import TestCase
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from example.models import Author, Book
+from like_system import background, bloom, leaderboard, metrics, signals, throttle
+from like_system.backends import get_backend
+from like_system.bloom import BloomFilter
+from like_system.cache import get_counter_shards, get_like_cache
+from like_system.compat import atomic
+from like_system.models import Like, LikeBucket, LikeCounter, LikeScore, PendingLike
+from like_system.instrumentation import capture, instrument
+from like_system.managers import LIKE, LikeOperation
+from like_system.resolvers import resolve_content_type
+from like_system.testing import LikeQueryBudgetMixin
 
 
 class BasicTests(TestCase):
@@ -8,4 +39,598 @@ class BasicTests(TestCase):
 
     def create_a_like_on_a_site(self):
 
-        self.assertEqual(1, 1)
\ No newline at end of file
+        self.assertEqual(1, 1)
+
+
+class LikeTestMixin(object):
+
+    def setUp(self):
+        self.user = User.objects.create_user('liker', 'liker@example.com', 'secret')
+        self.client.login(username='liker', password='secret')
+        self.author = Author.objects.create(name='Author')
+        self.book = Book.objects.create(name='Book', iban='1', author=self.author)
+        self.ctype = ContentType.objects.get_for_model(Book)
+
+    def like_url(self, obj, name='like_system-like'):
+        return reverse(name, kwargs={'content_type': 'example.book', 'object_pk': obj.pk})
+
+    def render(self, template, **context):
+        return Template('{% load likes %}' + template).render(Context(context))
+
+
+class LikeTestCase(LikeTestMixin, TestCase):
+    pass
+
+
+class LikeCounterTests(LikeTestCase):
+
+    def test_like_and_unlike_keep_counter_in_sync(self):
+        self.client.get(self.like_url(self.book))
+        self.client.get(self.like_url(self.book))
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 1)
+
+        self.client.get(self.like_url(self.book, 'like_system-unlike'))
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 0)
+
+    def test_count_tag_reads_counter(self):
+        LikeCounter.objects.incr(self.ctype, self.book.pk, settings.SITE_ID, 3)
+        with self.assertNumQueries(1):
+            output = self.render('{% get_like_count for book as n %}{{ n }}', book=self.book)
+        self.assertEqual(output, '3')
+
+
+class LikeConstraintTests(LikeTestCase):
+
+    def test_like_is_unique_per_user_and_object(self):
+        Like.objects.create(user=self.user, content_type=self.ctype,
+                            object_pk=self.book.pk, site_id=settings.SITE_ID)
+        with self.assertRaises(IntegrityError):
+            Like.objects.create(user=self.user, content_type=self.ctype,
+                                object_pk=self.book.pk, site_id=settings.SITE_ID)
+
+
+class LikeCountsTests(LikeTestCase):
+
+    def test_counts_for_object_list_in_one_query(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        LikeCounter.objects.incr(self.ctype, self.book.pk, settings.SITE_ID, 2)
+        with self.assertNumQueries(1):
+            output = self.render(
+                '{% get_like_counts for books as counts %}'
+                '{% for book in books %}{{ counts|for_object:book }},{% endfor %}',
+                books=[self.book, other])
+        self.assertEqual(output, '2,0,')
+
+
+class LikedThisTests(LikeTestCase):
+
+    def test_preloaded_liked_this_needs_no_queries(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        Like.objects.create(user=self.user, content_type=self.ctype,
+                            object_pk=self.book.pk, site_id=settings.SITE_ID)
+        Site.objects.get_current()
+        with self.assertNumQueries(1):
+            output = self.render(
+                '{% preload_liked for books %}'
+                '{% for book in books %}{% liked_this for book as liked %}{{ liked }},{% endfor %}',
+                books=[self.book, other], user=self.user)
+        self.assertEqual(output, 'True,False,')
+
+
+@override_settings(LIKE_CACHE_ALIAS='default')
+class LikeCacheTests(LikeTestCase):
+
+    def setUp(self):
+        super(LikeCacheTests, self).setUp()
+        get_like_cache().clear()
+
+    def test_count_is_served_from_cache_and_invalidated(self):
+        template = '{% get_like_count for book as n %}{{ n }}'
+        self.assertEqual(self.render(template, book=self.book), '0')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(template, book=self.book), '0')
+
+        self.client.get(self.like_url(self.book))
+        self.assertEqual(self.render(template, book=self.book), '1')
+
+    def test_liked_index_is_patched(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        targets = [(self.ctype, self.book.pk), (self.ctype, other.pk)]
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        self.assertEqual(Like.objects.liked_keys(self.user, targets, settings.SITE_ID),
+                         set([(self.ctype.pk, str(self.book.pk))]))
+
+        # answered from the cached index, patched by the like and the unlike
+        Like.objects.like(self.user, self.ctype, other.pk, settings.SITE_ID)
+        Like.objects.unlike(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        with self.assertNumQueries(0):
+            self.assertEqual(Like.objects.liked_keys(self.user, targets, settings.SITE_ID),
+                             set([(self.ctype.pk, str(other.pk))]))
+
+
+# the filters are only cached outside transactions
+@override_settings(LIKE_CACHE_ALIAS='default', LIKE_LIKED_INDEX=False, LIKE_BLOOM_FILTER=True)
+class BloomFilterTests(LikeTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        super(BloomFilterTests, self).setUp()
+        get_like_cache().clear()
+
+    def test_negatives_need_no_query(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        # builds the filter
+        self.assertEqual(Like.objects.liked_keys(self.user, [(self.ctype, other.pk)], settings.SITE_ID), set())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Like.objects.liked_keys(self.user, [(self.ctype, other.pk)], settings.SITE_ID), set())
+        Like.objects.like(self.user, self.ctype, other.pk, settings.SITE_ID)
+        with self.assertNumQueries(1):
+            self.assertEqual(Like.objects.liked_keys(self.user, [(self.ctype, other.pk)], settings.SITE_ID),
+                             set([(self.ctype.pk, str(other.pk))]))
+        # added once, by the like_added signal only
+        self.assertEqual(bloom.get_filter(self.user.pk, settings.SITE_ID).count, 2)
+
+    def test_filter_rebuilt_in_transaction_is_not_cached(self):
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        with atomic():
+            bloom.get_filter(self.user.pk, settings.SITE_ID)
+        self.assertEqual(get_like_cache().get(bloom.filter_key(self.user.pk, settings.SITE_ID)), None)
+
+    def test_filter_false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add((1, i))
+        self.assertTrue(all((1, i) in bloom for i in range(1000)))
+        false_positives = sum((2, i) in bloom for i in range(10000))
+        self.assertTrue(false_positives < 300, false_positives)
+
+
+class LikeWritePathTests(LikeTestCase):
+
+    def test_like_reports_state_changes_only(self):
+        site = Site.objects.get_current()
+        like, created = Like.objects.like(self.user, self.ctype, self.book.pk, site)
+        self.assertTrue(created)
+        again, created = Like.objects.like(self.user, self.ctype, self.book.pk, site)
+        self.assertFalse(created)
+        self.assertEqual(again.pk, like.pk)
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, site), 1)
+
+    def test_unlike_reports_state_changes_only(self):
+        site = Site.objects.get_current()
+        Like.objects.like(self.user, self.ctype, self.book.pk, site)
+        self.assertTrue(Like.objects.unlike(self.user, self.ctype, self.book.pk, site))
+        self.assertFalse(Like.objects.unlike(self.user, self.ctype, self.book.pk, site))
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, site), 0)
+
+
+class ResolverTests(LikeTestCase):
+
+    def test_tokens_resolve_from_memory(self):
+        resolve_content_type('example.book')
+        resolve_content_type('book')
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_content_type('example.book'), self.ctype)
+            self.assertEqual(resolve_content_type('book'), self.ctype)
+
+    def test_bare_model_name_still_likes(self):
+        self.client.get(reverse('like_system-like', kwargs={'content_type': 'book', 'object_pk': self.book.pk}))
+        self.assertEqual(Like.objects.count(), 1)
+
+
+class BulkTests(LikeTestCase):
+
+    def post_bulk(self, operations):
+        response = self.client.post(reverse('like_system-bulk'), json.dumps(operations),
+                                    content_type='application/json')
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_bulk_applies_operations_in_order(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        results = self.post_bulk([
+            {'action': 'like', 'content_type': 'example.book', 'object_pk': self.book.pk},
+            {'action': 'like', 'content_type': 'example.book', 'object_pk': self.book.pk},
+            {'action': 'like', 'content_type': 'example.book', 'object_pk': other.pk},
+            {'action': 'unlike', 'content_type': 'example.book', 'object_pk': other.pk},
+            {'action': 'like', 'content_type': 'nope.nope', 'object_pk': 1},
+        ])
+        self.assertEqual([result.get('changed') for result in results], [True, False, True, True, None])
+        self.assertFalse(results[-1]['ok'])
+        self.assertEqual(list(Like.objects.values_list('object_pk', flat=True)), [str(self.book.pk)])
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 1)
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, other.pk, settings.SITE_ID), 0)
+
+
+class StatusTests(LikeTestCase):
+
+    def test_status_returns_counts_and_liked_flags(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        url = '%s?objects=example.book:%s,example.book:%s' % (reverse('like_system-status'), self.book.pk, other.pk)
+        response = self.client.get(url)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {
+            'example.book:%s' % self.book.pk: {'count': 1, 'liked': True},
+            'example.book:%s' % other.pk: {'count': 0, 'liked': False},
+        })
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(LIKE_WRITE_BEHIND=True)
+class WriteBehindTests(LikeTestCase):
+
+    def test_queued_likes_are_visible_and_flushed(self):
+        self.client.get(self.like_url(self.book))
+        self.client.get(self.like_url(self.book, 'like_system-unlike'))
+        self.client.get(self.like_url(self.book))
+        self.assertEqual(Like.objects.count(), 0)
+        self.assertEqual(Like.objects.liked_keys(self.user, [(self.ctype, self.book.pk)], settings.SITE_ID),
+                         set([(self.ctype.pk, str(self.book.pk))]))
+
+        self.assertEqual(PendingLike.objects.flush(), 3)
+        self.assertEqual(PendingLike.objects.count(), 0)
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 1)
+
+
+class ShardedCounterTests(LikeTestCase):
+
+    @override_settings(LIKE_COUNTER_SHARDS=4)
+    def test_counts_sum_the_shards(self):
+        for i in range(8):
+            user = User.objects.create_user('user%d' % i, 'user%d@example.com' % i, 'secret')
+            Like.objects.like(user, self.ctype, self.book.pk, settings.SITE_ID)
+        self.assertTrue(LikeCounter.objects.count() <= 4)
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 8)
+        self.assertEqual(LikeCounter.objects.get_counts([(self.ctype, self.book.pk)], settings.SITE_ID),
+                         {(self.ctype.pk, str(self.book.pk)): 8})
+
+    @override_settings(LIKE_CACHE_ALIAS='default', LIKE_COUNTER_HOT_THRESHOLD=3, LIKE_COUNTER_HOT_SHARDS=8)
+    def test_hot_objects_are_promoted_to_more_shards(self):
+        get_like_cache().clear()
+        for i in range(3):
+            LikeCounter.objects.incr(self.ctype, self.book.pk, settings.SITE_ID)
+        self.assertEqual(get_counter_shards(self.ctype, self.book.pk, settings.SITE_ID), 8)
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 3)
+
+
+class TrendingTests(LikeTestCase):
+
+    def test_trending_sums_recent_buckets(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        friend = User.objects.create_user('friend', 'friend@example.com', 'secret')
+        for user in (self.user, friend):
+            Like.objects.like(user, self.ctype, self.book.pk, settings.SITE_ID)
+        Like.objects.like(self.user, self.ctype, other.pk, settings.SITE_ID)
+        Like.objects.unlike(self.user, self.ctype, other.pk, settings.SITE_ID)
+
+        self.assertEqual(LikeBucket.objects.trending(self.ctype, 'day', 10, settings.SITE_ID),
+                         [(str(self.book.pk), 2)])
+        output = self.render('{% get_trending for example.book hour 5 as trending %}'
+                             '{% for book, n in trending %}{{ book.name }}:{{ n }}{% endfor %}')
+        self.assertEqual(output, 'Book:2')
+
+    def test_backfill_rebuilds_buckets(self):
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        LikeBucket.objects.all().delete()
+        call_command('likes_backfill_buckets', verbosity=0)
+        self.assertEqual(LikeBucket.objects.trending(self.ctype, 'week', 10, settings.SITE_ID),
+                         [(str(self.book.pk), 1)])
+
+
+class TopLikedTests(LikeTestCase):
+
+    def setUp(self):
+        super(TopLikedTests, self).setUp()
+        leaderboard._leaderboards.clear()
+
+    def test_recent_likes_rank_first(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        # an older like weighs half as much per half-life
+        LikeScore.objects.add_weight(self.ctype, other.pk, settings.SITE_ID, leaderboard.current_weight() - 2)
+        self.assertEqual(leaderboard.top_liked(self.ctype, 10, settings.SITE_ID), [self.book, other])
+
+        output = self.render('{% get_top_liked for example.book 1 as top %}{% for book in top %}{{ book.name }}{% endfor %}')
+        self.assertEqual(output, 'Book')
+
+    def test_unlike_removes_score(self):
+        self.assertEqual(leaderboard.top_liked(self.ctype, 10, settings.SITE_ID), [])
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        self.assertEqual(leaderboard.top_liked(self.ctype, 10, settings.SITE_ID), [self.book])
+        Like.objects.unlike(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        self.assertFalse(LikeScore.objects.exists())
+        self.assertEqual(leaderboard.top_liked(self.ctype, 10, settings.SITE_ID), [])
+
+    def test_unlike_removes_weight_of_its_like(self):
+        two_days_ago = timezone.now() - timedelta(days=2)
+        users = [User.objects.create_user('old%d' % i, 'old%d@example.com' % i, 'secret') for i in range(3)]
+        Like.objects.bulk_apply([LikeOperation(LIKE, self.ctype.pk, self.book.pk, settings.SITE_ID, user.pk,
+                                               two_days_ago) for user in users])
+        Like.objects.unlike(users[0], self.ctype, self.book.pk, settings.SITE_ID)
+        hot = LikeScore.objects.get().hot
+        self.assertAlmostEqual(hot, leaderboard.like_weight(two_days_ago) + math.log(2))
+
+
+class LikePageTests(LikeTestCase):
+
+    def setUp(self):
+        super(LikePageTests, self).setUp()
+        self.likers = [self.user] + [User.objects.create_user('user%d' % i, 'user%d@example.com' % i, 'secret')
+                                     for i in range(4)]
+        for user in self.likers:
+            Like.objects.like(user, self.ctype, self.book.pk, settings.SITE_ID)
+
+    def test_pages_follow_cursor(self):
+        seen = []
+        cursor = None
+        while True:
+            page = Like.objects.page(self.ctype, self.book.pk, settings.SITE_ID, 2, after=cursor)
+            self.assertTrue(len(page) <= 2)
+            seen.extend(like.user for like in page)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(reversed(self.likers)))
+        self.assertEqual([like.user for like in Like.objects.iter_likes(self.ctype, self.book.pk, settings.SITE_ID, 2)],
+                         seen)
+        self.assertRaises(ValueError, Like.objects.page, self.ctype, self.book.pk, settings.SITE_ID, 2, 'bogus')
+
+    def test_tag_and_view(self):
+        output = self.render('{% get_like_list for book limit 3 as likes %}'
+                             '{{ likes|length }}{% if likes.next_cursor %}+{% endif %}', book=self.book)
+        self.assertEqual(output, '3+')
+
+        url = reverse('like_system-likers', kwargs={'content_type': 'example.book', 'object_pk': self.book.pk})
+        data = json.loads(self.client.get(url, {'limit': 3}).content.decode('utf-8'))
+        self.assertEqual([like['user'] for like in data['likes']], ['user3', 'user2', 'user1'])
+        data = json.loads(self.client.get(url, {'limit': 3, 'after': data['next']}).content.decode('utf-8'))
+        self.assertEqual([like['user'] for like in data['likes']], ['user0', 'liker'])
+        self.assertEqual(data['next'], None)
+        self.assertEqual(self.client.get(url, {'after': 'bogus'}).status_code, 400)
+
+    def test_export_streams_csv_to_staff(self):
+        url = reverse('like_system-export', kwargs={'content_type': 'example.book', 'object_pk': self.book.pk})
+        self.assertEqual(self.client.get(url).status_code, 403)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(url)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), len(self.likers) + 1)
+        self.assertTrue(lines[1].startswith('user3,'))
+
+    def test_list_loads_users_in_one_query(self):
+        template = '{% get_like_list for book as likes %}{% for like in likes %}{{ like }} {% endfor %}'
+        with self.assertNumQueries(1):
+            output = self.render(template, book=self.book)
+        self.assertEqual(output, 'user3 user2 user1 user0 liker ')
+
+        template = '{% get_like_list for book rows limit 2 as likes %}{% for like in likes %}{{ like.username }} {% endfor %}'
+        with self.assertNumQueries(1):
+            self.assertEqual(self.render(template, book=self.book), 'user3 user2 ')
+
+    def test_str_without_user(self):
+        self.assertEqual(str(Like(user=None)), 'N/A')
+
+
+class TransferTests(LikeTestCase):
+
+    def setUp(self):
+        super(TransferTests, self).setUp()
+        self.friend = User.objects.create_user('friend', 'friend@example.com', 'secret')
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        Like.objects.like(self.friend, self.ctype, self.book.pk, settings.SITE_ID)
+
+    def export_and_import(self, filename):
+        path = os.path.join(tempfile.mkdtemp(), filename)
+        call_command('likes_export', output=path, chunk_size=1, verbosity=0)
+        Like.objects.filter(user=self.friend).delete()
+        LikeCounter.objects.all().delete()
+        LikeScore.objects.all().delete()
+        call_command('likes_import', path, chunk_size=1, verbosity=0)
+        os.remove(path)
+
+    def test_round_trip_jsonl(self):
+        submit_date = Like.objects.get(user=self.friend).submit_date
+        self.export_and_import('likes.jsonl')
+        self.assertEqual(Like.objects.get(user=self.friend).submit_date, submit_date)
+        self.assertEqual(Like.objects.count(), 2)
+        # only the missing like was imported, counted and scored
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 1)
+        self.assertAlmostEqual(LikeScore.objects.get(object_pk=str(self.book.pk)).hot,
+                               leaderboard.like_weight(submit_date))
+
+    def test_round_trip_csv(self):
+        self.export_and_import('likes.csv')
+        self.assertEqual(sorted(Like.objects.values_list('user__username', flat=True)), ['friend', 'liker'])
+
+
+class RecountTests(LikeTestCase):
+
+    def test_recount_corrects_drift(self):
+        other = Book.objects.create(name='Other', iban='2', author=self.author)
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        Like.objects.like(self.user, self.ctype, other.pk, settings.SITE_ID)
+        LikeCounter.objects.filter(object_pk=str(self.book.pk)).update(count=5)
+        LikeCounter.objects.filter(object_pk=str(other.pk)).delete()
+
+        call_command('likes_recount', dry_run=True, processes=1, verbosity=0)
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 5)
+
+        call_command('likes_recount', processes=1, partitions=2, verbosity=0)
+        self.assertEqual(LikeCounter.objects.get_counts([(self.ctype, self.book.pk), (self.ctype, other.pk)],
+                                                        settings.SITE_ID),
+                         {(self.ctype.pk, str(self.book.pk)): 1, (self.ctype.pk, str(other.pk)): 1})
+
+
+class InstrumentationTests(LikeQueryBudgetMixin, LikeTestCase):
+
+    def test_tags_and_views_are_measured(self):
+        Like.objects.like(self.user, self.ctype, self.book.pk, settings.SITE_ID)
+        received = []
+        handler = lambda sender, measurement, **kwargs: received.append(measurement)
+        signals.operation_measured.connect(handler)
+        try:
+            with capture() as measurements:
+                self.render('{% get_like_count for book as n %}', book=self.book)
+                self.client.get(self.like_url(self.book, 'like_system-unlike'))
+        finally:
+            signals.operation_measured.disconnect(handler)
+
+        self.assertEqual([m.name for m in measurements], ['tag:LikeCountNode', 'view:unlike'])
+        self.assertEqual(measurements[0].queries, 1)
+        self.assertTrue(measurements[1].queries > 0)
+        self.assertEqual(received, measurements)
+
+    def test_query_budget(self):
+        books = [self.book] + [Book.objects.create(name='Book %d' % i, iban=str(i), author=self.author)
+                               for i in range(3)]
+        template = ('{% preload_liked for books %}{% get_like_counts for books as counts %}'
+                    '{% for book in books %}{% liked_this for book as liked %}{{ counts|for_object:book }}{% endfor %}')
+        Site.objects.get_current()
+        with self.assertLikeQueries(2):
+            self.render(template, books=books, user=self.user)
+
+        def over_budget():
+            with self.assertLikeQueries(3):
+                for book in books:
+                    self.render('{% get_like_count for book as n %}', book=book)
+        self.assertRaises(AssertionError, over_budget)
+
+    def test_nested_measurements(self):
+        def measured():
+            with instrument('outer'):
+                Like.objects.count()
+                with instrument('inner'):
+                    Like.objects.count()
+
+        with capture() as measurements:
+            measured()
+        self.assertEqual([(m.name, m.queries, m.depth) for m in measurements], [('inner', 1, 1), ('outer', 2, 0)])
+        with self.assertLikeQueries(2):
+            measured()
+
+
+@override_settings(LIKE_METRICS_ENABLED=True)
+class MetricsTests(LikeTestCase):
+
+    def get_writes(self, result):
+        counters, histograms = metrics.collect_all()
+        return counters.get(('like_system_writes_total', (('action', 'like'), ('result', result))), 0)
+
+    def test_metrics_view(self):
+        changed, noop = self.get_writes('changed'), self.get_writes('noop')
+        self.client.get(self.like_url(self.book))
+        self.client.get(self.like_url(self.book))
+        self.assertEqual(self.get_writes('changed'), changed + 1)
+        self.assertEqual(self.get_writes('noop'), noop + 1)
+
+        response = self.client.get(reverse('like_system-metrics'))
+        content = response.content.decode('utf-8')
+        self.assertTrue('# TYPE like_system_writes_total counter' in content)
+        self.assertTrue('like_system_operation_seconds_bucket{operation="view:like",le="+Inf"}' in content)
+
+        with self.settings(LIKE_METRICS_ENABLED=False):
+            self.assertEqual(self.client.get(reverse('like_system-metrics')).status_code, 404)
+
+    def test_spool_directory(self):
+        spool_dir = tempfile.mkdtemp()
+        with self.settings(LIKE_METRICS_DIR=spool_dir):
+            changed = self.get_writes('changed')
+            self.client.get(self.like_url(self.book))
+            # the totals of another worker process, and of one that exited
+            exited = subprocess.Popen([sys.executable, '-c', ''])
+            exited.wait()
+            for pid in (os.getppid(), exited.pid):
+                with open(os.path.join(spool_dir, 'likes-%d-1.json' % pid), 'w') as spool_file:
+                    json.dump({'counters': [['like_system_writes_total', [['action', 'like'], ['result', 'changed']],
+                                             2]],
+                               'histograms': []}, spool_file)
+            self.assertEqual(self.get_writes('changed'), changed + 3)
+            self.assertFalse(os.path.exists(os.path.join(spool_dir, 'likes-%d-1.json' % exited.pid)))
+        for filename in os.listdir(spool_dir):
+            os.remove(os.path.join(spool_dir, filename))
+        os.rmdir(spool_dir)
+
+
+@override_settings(LIKE_STORAGE_BACKEND='like_system.backends.memory.MemoryBackend')
+class MemoryBackendTests(LikeTestCase):
+
+    def setUp(self):
+        super(MemoryBackendTests, self).setUp()
+        self.backend = get_backend()
+        self.backend.clear()
+
+    def test_views_and_tags_use_backend(self):
+        self.client.get(self.like_url(self.book))
+        self.client.get(self.like_url(self.book))
+        self.assertFalse(Like.objects.exists())
+        self.assertTrue(self.backend.exists(self.user, self.ctype, self.book.pk, settings.SITE_ID))
+        self.assertEqual(self.backend.count(self.ctype, self.book.pk, settings.SITE_ID), 1)
+
+        template = ('{% get_like_count for book as n %}{% liked_this for book as liked %}'
+                    '{% get_like_list for book as likes %}{{ n }} {{ liked }} {{ likes.0 }}')
+        self.assertEqual(self.render(template, book=self.book, user=self.user), '1 True liker')
+
+        self.client.get(self.like_url(self.book, 'like_system-unlike'))
+        self.assertEqual(self.backend.bulk_count([(self.ctype, self.book.pk)], settings.SITE_ID),
+                         {(self.ctype.pk, str(self.book.pk)): 0})
+
+    def test_pages(self):
+        for i in range(3):
+            self.backend.add(i + 1, self.ctype, self.book.pk, settings.SITE_ID)
+        page = self.backend.list(self.ctype, self.book.pk, settings.SITE_ID, 2)
+        self.assertEqual([row.user_id for row in page], [3, 2])
+        page = self.backend.list(self.ctype, self.book.pk, settings.SITE_ID, 2, page.next_cursor)
+        self.assertEqual([row.user_id for row in page], [1])
+        self.assertEqual(page.next_cursor, None)
+
+
+@override_settings(LIKE_BACKGROUND_SIGNALS=True, LIKE_LEADERBOARD=False)
+class BackgroundSignalsTests(LikeTestCase):
+
+    def test_signals_are_sent_by_workers(self):
+        threads = []
+        handler = lambda sender, **kwargs: threads.append(threading.current_thread())
+        signals.like_added.connect(handler)
+        try:
+            self.client.get(self.like_url(self.book))
+            background.wait()
+        finally:
+            signals.like_added.disconnect(handler)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.current_thread())
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 1)
+
+
+@override_settings(LIKE_THROTTLE=True)
+class ThrottleTests(LikeTestCase):
+
+    def setUp(self):
+        super(ThrottleTests, self).setUp()
+        throttle._memory_store = throttle.MemoryStore()
+
+    def test_repeated_clicks_are_coalesced(self):
+        url = self.like_url(self.book) + '?return=/book/'
+        applied = self.client.get(url)
+        with self.assertNumQueries(1):
+            # only the session is loaded
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, applied.status_code)
+        self.assertEqual(response['Location'], applied['Location'])
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 1)
+
+        self.client.get(self.like_url(self.book, 'like_system-unlike'))
+        self.client.get(self.like_url(self.book))
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 1)
+
+    @override_settings(LIKE_THROTTLE_USER_RATE='2/m', LIKE_THROTTLE_COALESCE_WINDOW=0)
+    def test_click_storm_is_rejected(self):
+        self.client.get(self.like_url(self.book))
+        self.client.get(self.like_url(self.book, 'like_system-unlike'))
+        response = self.client.get(self.like_url(self.book))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(LikeCounter.objects.get_count(self.ctype, self.book.pk, settings.SITE_ID), 0)
@@ -0,0 +1,194 @@
+"""
+Throttling of the like and unlike views, applied before any query is made.
+
+Each user (or client address for anonymous requests) and each object has a
+token bucket; a request takes a token from both or is rejected with a 429
+response. Identical requests of a logged in user repeated within
+``LIKE_THROTTLE_COALESCE_WINDOW`` seconds are answered as if applied, without
+touching the database::
+
+    LIKE_THROTTLE = True
+    LIKE_THROTTLE_USER_RATE = '30/m'
+    LIKE_THROTTLE_OBJECT_RATE = '100/s'
+    LIKE_THROTTLE_COALESCE_WINDOW = 2
+
+Buckets live in the like cache when enabled (shared by all processes, but
+updated without a lock so concurrent requests may share a token), otherwise
+in the memory of the process.
+"""
+import hashlib
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.http.response import HttpResponse, HttpResponseRedirect
+from django.utils.encoding import force_bytes, smart_text
+
+from like_system import metrics
+from like_system.cache import DEFAULT_KEY_PREFIX, get_like_cache
+
+DEFAULT_USER_RATE = '30/m'
+DEFAULT_OBJECT_RATE = '100/s'
+DEFAULT_COALESCE_WINDOW = 2
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def is_enabled():
+    return getattr(settings, 'LIKE_THROTTLE', False)
+
+
+def parse_rate(rate):
+    """
+    Parse a ``'requests/period'`` rate, the period being ``s``, ``m``, ``h``
+    or ``d``. Returns the ``(capacity, seconds)`` of the bucket.
+    """
+    requests, period = rate.split('/')
+    return int(requests), PERIODS[period[0]]
+
+
+class MemoryStore(object):
+    """
+    Buckets and last actions in the memory of the process.
+    """
+    max_entries = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def _cull(self, now):
+        if len(self.entries) > self.max_entries:
+            for key, (value, expires) in list(self.entries.items()):
+                if expires <= now:
+                    del self.entries[key]
+
+    def update(self, key, func, timeout):
+        now = time.time()
+        with self.lock:
+            value, expires = self.entries.get(key, (None, 0))
+            value, result = func(value if expires > now else None)
+            self.entries[key] = (value, now + timeout)
+            self._cull(now)
+        return result
+
+
+class CacheStore(object):
+    """
+    Buckets and last actions in the like cache.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def update(self, key, func, timeout):
+        value, result = func(self.cache.get(key))
+        self.cache.set(key, value, timeout)
+        return result
+
+
+_memory_store = MemoryStore()
+
+
+def get_store():
+    cache = get_like_cache()
+    return _memory_store if cache is None else CacheStore(cache)
+
+
+def take_token(store, key, rate):
+    """
+    Take a token from a bucket. Returns 0, or the seconds until a token is
+    available when the bucket is empty.
+    """
+    capacity, period = parse_rate(rate)
+    now = time.time()
+
+    def take(bucket):
+        tokens, stamp = bucket or (capacity, now)
+        tokens = min(capacity, tokens + (now - stamp) * capacity / float(period))
+        if tokens < 1:
+            return (tokens, now), (1 - tokens) * period / float(capacity)
+        return (tokens - 1, now), 0
+    return store.update(key, take, period)
+
+
+def make_key(*parts):
+    """
+    Build the key of a bucket or last action, hashed to keep it
+    memcached safe.
+    """
+    return '%s:throttle:%s' % (
+        getattr(settings, 'LIKE_CACHE_KEY_PREFIX', DEFAULT_KEY_PREFIX),
+        hashlib.md5(force_bytes(':'.join(parts))).hexdigest(),
+    )
+
+
+def is_repeated(store, key, action, window):
+    """
+    Record the action of a client on an object, returning True when it
+    repeats the previous one within the window.
+    """
+    return store.update(key, lambda last: (action, last == action), window)
+
+
+def get_client_id(request):
+    """
+    Identify the client without a query: the user id stored in the session,
+    or the address of anonymous clients. Returns the id and whether the
+    client is logged in.
+    """
+    user_id = request.session.get(SESSION_KEY) if hasattr(request, 'session') else None
+    if user_id is not None:
+        return 'user:%s' % user_id, True
+    return 'addr:%s' % request.META.get('REMOTE_ADDR', ''), False
+
+
+def done_response(request):
+    """
+    Answer an applied like or unlike: redirect to the return path given in
+    the url, if any.
+    """
+    try:
+        return HttpResponseRedirect(request.GET.get('return'))
+    except:
+        return HttpResponse(True)
+
+
+def throttle(action):
+    """
+    Decorate a like or unlike view taking ``content_type`` and ``object_pk``
+    with the throttle, when enabled.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, content_type=None, object_pk=None):
+            if not is_enabled():
+                return view(request, content_type, object_pk)
+            store = get_store()
+            client_id, logged_in = get_client_id(request)
+            target = '%s:%s' % (content_type, smart_text(object_pk))
+
+            window = getattr(settings, 'LIKE_THROTTLE_COALESCE_WINDOW', DEFAULT_COALESCE_WINDOW)
+            last_key = make_key('last', target, client_id)
+            # anonymous likes are refused by the view, never coalesce them
+            if window and logged_in and is_repeated(store, last_key, action, window):
+                metrics.inc('like_system_throttled_total', action=action, reason='coalesced')
+                return done_response(request)
+
+            wait = (take_token(store, make_key('user', client_id),
+                               getattr(settings, 'LIKE_THROTTLE_USER_RATE', DEFAULT_USER_RATE)) or
+                    take_token(store, make_key('object', target),
+                               getattr(settings, 'LIKE_THROTTLE_OBJECT_RATE', DEFAULT_OBJECT_RATE)))
+            if wait:
+                metrics.inc('like_system_throttled_total', action=action, reason='rate')
+                if window and logged_in:
+                    # the rejected action was not applied, do not coalesce its retry
+                    store.update(last_key, lambda last: (None, None), window)
+                response = HttpResponse(False, status=429)
+                response['Retry-After'] = str(int(math.ceil(wait)))
+                return response
+            return view(request, content_type, object_pk)
+        return inner
+    return decorator
@@ -0,0 +1,105 @@
+"""
+Reading and writing likes as JSON lines or CSV, for the ``likes_export`` and
+``likes_import`` commands and the CSV export view.
+
+Likes are written with portable references, the ``app_label.model`` token of
+their content type, the domain of their site and the username of their
+user::
+
+    {"content_type": "example.book", "object_pk": "1", "site": "example.com",
+     "user": "alice", "submit_date": "2014-05-01T10:00:00+00:00"}
+"""
+import csv
+import json
+import sys
+
+from django.conf import settings
+from django.utils import six, timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+
+FIELDS = ('content_type', 'object_pk', 'site', 'user', 'submit_date')
+FORMATS = ('jsonl', 'csv')
+
+
+class Echo(object):
+    """A file-like object handing back what is written, for ``csv.writer``."""
+    def write(self, value):
+        return value
+
+
+def csv_line(values):
+    """
+    Return a CSV line of ``values``, byte strings on Python 2 whose csv
+    module does not handle unicode.
+    """
+    if six.PY2:
+        values = [force_bytes(value) for value in values]
+    return csv.writer(Echo()).writerow(values)
+
+
+def guess_format(path, format=None):
+    """
+    Return the format given, or the one of the extension of ``path``,
+    defaulting to JSON lines.
+    """
+    if format is None:
+        format = 'csv' if path and path.lower().endswith('.csv') else 'jsonl'
+    if format not in FORMATS:
+        raise ValueError("Unknown format %r, use one of %s" % (format, ', '.join(FORMATS)))
+    return format
+
+
+def open_output(path):
+    if six.PY2:
+        return open(path, 'w')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    if six.PY2:
+        return open(path, 'rb')
+    return open(path, encoding='utf-8', newline='')
+
+
+def header(format):
+    return csv_line(FIELDS) if format == 'csv' else ''
+
+
+def dump_row(format, row):
+    """
+    Return the line of a like given as a dict of ``FIELDS``.
+    """
+    row = dict(row, submit_date=row['submit_date'].isoformat())
+    if format == 'csv':
+        return csv_line(['' if row[field] is None else row[field] for field in FIELDS])
+    return json.dumps(dict((field, row[field]) for field in FIELDS), sort_keys=True) + '\n'
+
+
+def load_rows(format, lines):
+    """
+    Iterate over the likes of a file as dicts of ``FIELDS``.
+    """
+    if format == 'csv':
+        for row in csv.DictReader(lines):
+            yield dict((force_text(key), force_text(value)) for key, value in row.items())
+    else:
+        for line in lines:
+            line = force_text(line).strip()
+            if line:
+                yield json.loads(line)
+
+
+def parse_submit_date(value):
+    """
+    Parse an ISO 8601 date, raising ValueError when it is invalid. Naive
+    dates are in the current time zone.
+    """
+    submit_date = parse_datetime(value or '')
+    if submit_date is None:
+        raise ValueError(value)
+    if settings.USE_TZ and timezone.is_naive(submit_date):
+        submit_date = timezone.make_aware(submit_date, timezone.get_current_timezone())
+    return submit_date
@@ -2,6 +2,11 @@ from django.conf.urls import patterns, url
 
 
 urlpatterns = patterns('like_system.views',
-    url(r'unlike/(?P<content_type>\w+)/(?P<object_pk>[0-9]+)', 'unlike', name='like_system-unlike'),
-    url(r'like/(?P<content_type>\w+)/(?P<object_pk>[0-9]+)', 'like', name='like_system-like'),
+    url(r'unlike/(?P<content_type>[\w.]+)/(?P<object_pk>[0-9]+)', 'unlike', name='like_system-unlike'),
+    url(r'like/(?P<content_type>[\w.]+)/(?P<object_pk>[0-9]+)', 'like', name='like_system-like'),
+    url(r'^bulk$', 'bulk', name='like_system-bulk'),
+    url(r'^status$', 'status', name='like_system-status'),
+    url(r'^metrics$', 'metrics', name='like_system-metrics'),
+    url(r'^likes/(?P<content_type>[\w.]+)/(?P<object_pk>[0-9]+)$', 'likers', name='like_system-likers'),
+    url(r'^likes/(?P<content_type>[\w.]+)/(?P<object_pk>[0-9]+)/export$', 'export', name='like_system-export'),
 )
\ No newline at end of file
@@ -1,60 +1,246 @@
+import hashlib
+import json
+
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import get_current_site
-from django.http.response import HttpResponse, HttpResponseRedirect
+from django.http import Http404
+from django.http.response import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.encoding import force_bytes, smart_text
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_GET, require_POST
+
+from like_system import cache as like_cache
+from like_system import metrics as like_metrics
+from like_system.instrumentation import instrument
+from like_system.managers import LIKE, UNLIKE, LikeOperation, write_behind_enabled
+from like_system.backends import get_backend
+from like_system.models import PendingLike
+from like_system.resolvers import resolve_content_type, resolve_target
+from like_system.throttle import done_response, throttle
+from like_system.transfer import csv_line
+
+DEFAULT_BULK_MAX_OPERATIONS = 500
+DEFAULT_STATUS_MAX_OBJECTS = 300
+DEFAULT_STATUS_MAX_AGE = 10
+DEFAULT_LIKERS_PAGE_SIZE = 50
+DEFAULT_LIKERS_MAX_PAGE_SIZE = 200
+DEFAULT_EXPORT_CHUNK_SIZE = 1000
 
-from like_system.models import Like
 
+def json_response(data, status=200):
+    return HttpResponse(json.dumps(data), content_type='application/json', status=status)
 
+
+@instrument('view:like')
+@throttle(LIKE)
 def like(request, content_type=None, object_pk=None):
+    if not request.user.is_authenticated():
+        return HttpResponse(False)
+
     # validate the url parameters
     try:
-        ct = ContentType.objects.get(model=content_type)
-        site = get_current_site(request)
+        ct, site = resolve_target(request, content_type)
     except:
         return HttpResponse(False)
 
-    # make this unique
-    try:
-        like = Like.objects.get(user=request.user,
-                                content_type=ct,
-                                site=site,
-                                object_pk=object_pk
-        )
-    except:
-        like = Like(user=request.user,
-                    content_type=ct,
-                    site=site,
-                    object_pk=object_pk,
-        )
-        like.save()
-
-    # return path given in url
-    try:
-        return HttpResponseRedirect(request.GET.get('return'))
-    except:
-        pass
+    if write_behind_enabled():
+        PendingLike.objects.enqueue(LIKE, request.user, ct, object_pk, site)
+        like_metrics.inc('like_system_writes_total', action=LIKE, result='queued')
+    else:
+        # unique per user, only a new like moves the counter
+        created = get_backend().add(request.user, ct, object_pk, site)
+        like_metrics.inc('like_system_writes_total', action=LIKE, result='changed' if created else 'noop')
 
-    return HttpResponse(like)
+    return done_response(request)
 
 
+@instrument('view:unlike')
+@throttle(UNLIKE)
 def unlike(request, content_type=None, object_pk=None):
     # validate the url parameters
     try:
-        ct = ContentType.objects.get(model=content_type)
-        site = get_current_site(request)
-        # delete unique like
-        Like.objects.get(user=request.user,
-                         content_type=ct,
-                         site=site,
-                         object_pk=object_pk
-        ).delete()
+        ct, site = resolve_target(request, content_type)
+        if write_behind_enabled():
+            PendingLike.objects.enqueue(UNLIKE, request.user, ct, object_pk, site)
+            like_metrics.inc('like_system_writes_total', action=UNLIKE, result='queued')
+        else:
+            # delete unique like, a no-op when there is none
+            removed = get_backend().remove(request.user, ct, object_pk, site)
+            like_metrics.inc('like_system_writes_total', action=UNLIKE, result='changed' if removed else 'noop')
     except:
         pass
 
-    # return path given in url
+    return done_response(request)
+
+
+@require_POST
+def bulk(request):
+    """
+    Apply a JSON array of like and unlike operations of the current user in
+    one transaction::
+
+        [{"action": "like", "content_type": "app.model", "object_pk": "1"},
+         {"action": "unlike", "content_type": "app.model", "object_pk": "2"}]
+
+    Responds with one ``{"ok": ..., "changed": ...}`` result per operation.
+    """
+    if not request.user.is_authenticated():
+        return json_response({'error': 'authentication required'}, status=403)
+
     try:
-        return HttpResponseRedirect(request.GET.get('return'))
-    except:
-        pass
+        items = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return json_response({'error': 'invalid JSON'}, status=400)
+    if not isinstance(items, list):
+        return json_response({'error': 'expected a list of operations'}, status=400)
+    if len(items) > getattr(settings, 'LIKE_BULK_MAX_OPERATIONS', DEFAULT_BULK_MAX_OPERATIONS):
+        return json_response({'error': 'too many operations'}, status=400)
+
+    site = get_current_site(request)
+    results = []
+    operations = []
+    for item in items:
+        try:
+            if item['action'] not in (LIKE, UNLIKE):
+                raise ValueError(item['action'])
+            ct = resolve_content_type(item['content_type'])
+            object_pk = smart_text(item['object_pk'])
+        except (KeyError, TypeError, ValueError, ContentType.DoesNotExist):
+            results.append({'ok': False, 'error': 'invalid operation'})
+            continue
+        results.append({'ok': True})
+        operations.append((results[-1], LikeOperation(item['action'], ct.pk, object_pk, site.pk, request.user.pk)))
+
+    changed = get_backend().bulk_apply([op for result, op in operations])
+    for (result, op), op_changed in zip(operations, changed):
+        result['changed'] = op_changed
+        like_metrics.inc('like_system_writes_total', action=op.action, result='changed' if op_changed else 'noop')
+    return json_response(results)
+
+
+@require_GET
+def status(request):
+    """
+    Return the like count and whether the current user liked each object of
+    the ``objects`` parameter, a comma separated list of ``app.model:pk``::
+
+        GET status?objects=example.book:1,example.book:2
+
+        {"example.book:1": {"count": 3, "liked": true},
+         "example.book:2": {"count": 0, "liked": false}}
+
+    Answered with one count query and one liked query, and an ETag so
+    clients and proxies can revalidate with ``If-None-Match``.
+    """
+    tokens = [token for value in request.GET.getlist('objects') for token in value.split(',') if token]
+    if len(tokens) > getattr(settings, 'LIKE_STATUS_MAX_OBJECTS', DEFAULT_STATUS_MAX_OBJECTS):
+        return json_response({'error': 'too many objects'}, status=400)
+
+    targets = {}
+    try:
+        for token in tokens:
+            ct_token, object_pk = token.split(':', 1)
+            targets[token] = (resolve_content_type(ct_token).pk, object_pk)
+    except (ValueError, ContentType.DoesNotExist):
+        return json_response({'error': 'invalid object %r' % token}, status=400)
+
+    site = get_current_site(request)
+    backend = get_backend()
+    counts = like_cache.get_many_or_load('count', targets.values(), site.pk,
+        lambda missing: backend.bulk_count(missing, site.pk))
+    if request.user.is_authenticated():
+        liked = backend.bulk_exists(request.user, targets.values(), site.pk)
+    else:
+        liked = set()
+
+    data = dict((token, {'count': counts[key], 'liked': key in liked}) for token, key in targets.items())
+    content = json.dumps(data, sort_keys=True)
+    etag = hashlib.md5(force_bytes(content)).hexdigest()
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = quote_etag(etag)
+
+    # the liked flags make the answer specific to the user
+    max_age = getattr(settings, 'LIKE_STATUS_MAX_AGE', DEFAULT_STATUS_MAX_AGE)
+    if request.user.is_authenticated():
+        patch_cache_control(response, private=True, max_age=max_age)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+@require_GET
+def likers(request, content_type=None, object_pk=None):
+    """
+    Return a page of the likes of an object, newest first::
+
+        GET likes/example.book/1?limit=2
+
+        {"likes": [{"user": "alice", "submit_date": "2014-05-01T10:00:00+00:00"},
+                   {"user": "bob", "submit_date": "2014-05-01T09:30:00+00:00"}],
+         "next": "20140501093000000000-17"}
+
+    The following page is requested with ``?after=<next>``, ``next`` is null
+    on the last page.
+    """
+    try:
+        ct, site = resolve_target(request, content_type)
+    except ContentType.DoesNotExist:
+        return json_response({'error': 'invalid content type'}, status=404)
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIKERS_PAGE_SIZE))
+        if not 0 < limit <= getattr(settings, 'LIKE_LIKERS_MAX_PAGE_SIZE', DEFAULT_LIKERS_MAX_PAGE_SIZE):
+            raise ValueError(limit)
+        page = get_backend().list(ct, object_pk, site, limit, request.GET.get('after'), rows=True)
+    except ValueError:
+        return json_response({'error': 'invalid limit or cursor'}, status=400)
+
+    return json_response({
+        'likes': [{'user': like.username,
+                   'submit_date': like.submit_date.isoformat()} for like in page],
+        'next': page.next_cursor,
+    })
+
+
+def export_rows(likes):
+    yield csv_line(['user', 'submit_date'])
+    for like in likes:
+        yield csv_line([like.username or '', like.submit_date.isoformat()])
+
+
+@require_GET
+def export(request, content_type=None, object_pk=None):
+    """
+    Stream all the likes of an object as CSV, to staff users. The likes are
+    read one keyset page at a time, so the export runs in constant memory
+    however many likes the object has.
+    """
+    if not request.user.is_staff:
+        return HttpResponse(status=403)
+    try:
+        ct, site = resolve_target(request, content_type)
+    except ContentType.DoesNotExist:
+        return HttpResponse(status=404)
+
+    chunk_size = getattr(settings, 'LIKE_EXPORT_CHUNK_SIZE', DEFAULT_EXPORT_CHUNK_SIZE)
+    likes = get_backend().iter_likes(ct, object_pk, site, chunk_size, rows=True)
+    response = StreamingHttpResponse(export_rows(likes), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="likes-%s-%s.csv"' % (content_type, object_pk)
+    return response
+
 
-    return HttpResponse(True)
\ No newline at end of file
+@require_GET
+def metrics(request):
+    """
+    Serve the like metrics in the Prometheus text format, when
+    ``LIKE_METRICS_ENABLED`` is set. See ``like_system.metrics``.
+    """
+    if not like_metrics.is_enabled():
+        raise Http404
+    counters, histograms = like_metrics.collect_all()
+    return HttpResponse(like_metrics.render_text(counters, histograms), content_type='text/plain; version=0.0.4')
@@ -6,7 +6,14 @@ setup(
     version='0.0.1-alpha2',
     author=u'Domenik Jones',
     author_email='domenik.jones.gmail.com',
-    packages=['like_system'],
+    packages=[
+        'like_system',
+        'like_system.backends',
+        'like_system.management',
+        'like_system.management.commands',
+        'like_system.migrations',
+        'like_system.templatetags',
+    ],
     url='https://github.com/r00tl3ss/django-like-system.git',
     license='BSD licence, see LICENCE.rst',
     description='Django based like system. Inspired by django.contrib.comments.',